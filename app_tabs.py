@@ -1,28 +1,33 @@
 # app.py — four-tab layout (Chat, Photos, Knowledge Base, Settings)
 
-import os, json, shutil
-from datetime import datetime
+import os
 from typing import List
 import streamlit as st
 from dotenv import load_dotenv
+
+# before the project imports below: they read their settings (KNOWLEDGE_DIR, KB_*,
+# FAISS_*, EMBEDDING_DIMENSIONS, ...) from the environment when they load
+load_dotenv()
+
 from PIL import Image
 import streamlit.components.v1 as components
 
 # --- RAG deps ---
-from pypdf import PdfReader
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationalRetrievalChain
+from knowledge_base import (
+    KB_SHARDED, KNOWLEDGE_DIR, EmbeddingMismatch, doc_name, kb_exists, kb_fingerprint, kb_image_only,
+    kb_manifest, kb_quarantined, kb_staleness, list_pdfs, shard_of,
+)
+from index_builder import builder as index_builder
+import serving
+from serving import get_llm, get_shared_vectorstore
 
 # ---------------- Config ----------------
-load_dotenv()
 st.set_page_config(page_title="AI in Geotechnical Construction", page_icon="🏛️", layout="wide")
+# no-op when launched through serve.py, which has already started warm-up
+serving.start(os.getenv("OPENAI_API_KEY", "").strip())
 
-VECTORSTORE_DIR = "vectorstore"
-METADATA_PATH   = os.path.join(VECTORSTORE_DIR, "metadata.json")
 PHOTOS_DIR      = "photos"
 DEEP_FOUNDATION_DIR = os.path.join(os.path.dirname(__file__), "Deep_foundation")
 SHALLOW_FOUNDATION_DIR = os.path.join(os.path.dirname(__file__), "Shallow_foundation")
@@ -31,24 +36,12 @@ SHALLOW_FOUNDATION_DIR = os.path.join(os.path.dirname(__file__), "Shallow_founda
 os.makedirs(DEEP_FOUNDATION_DIR, exist_ok=True)
 os.makedirs(SHALLOW_FOUNDATION_DIR, exist_ok=True)
 
-MODEL_NAME      = "gpt-4o-mini"
-TEMPERATURE     = 0.0
-
 PRIMARY_BLUE = "#0F4C81"
 SUNY_GOLD    = "#FFC72C"
 APP_BG       = "#F4F6FA"
 PANEL_BG     = "#ffffff"
 
 # ---------------- Utilities ----------------
-def _load_faiss(path: str, embeddings: OpenAIEmbeddings) -> FAISS:
-    try:
-        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
-    except TypeError:
-        return FAISS.load_local(path, embeddings)
-
-def list_pdfs_in_cwd() -> List[str]:
-    return [f for f in sorted(os.listdir()) if os.path.isfile(f) and f.lower().endswith(".pdf")]
-
 def list_images() -> List[str]:
     exts = (".png", ".jpg", ".jpeg", ".webp")
     os.makedirs(PHOTOS_DIR, exist_ok=True)
@@ -87,48 +80,57 @@ def fix_image_orientation(img: Image.Image) -> Image.Image:
     
     return img
 
-def load_docs_from_files(pdf_files):
-    docs = []
-    for pdf in pdf_files:
-        try:
-            reader = PdfReader(pdf)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text() or ""
-                if text.strip():
-                    docs.append(Document(page_content=text, metadata={"source": os.path.basename(pdf), "page": i + 1}))
-        except Exception as e:
-            st.warning(f"Could not read {pdf}: {e}")
-    return docs
-
-def split_docs(docs):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    return splitter.split_documents(docs)
-
 def build_or_load_vectorstore(api_key: str):
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=api_key)
-
-    if os.path.isdir(VECTORSTORE_DIR):
-        return _load_faiss(VECTORSTORE_DIR, embeddings)
-
-    pdfs = list_pdfs_in_cwd()
-    if not pdfs:
-        return None
-
-    docs = load_docs_from_files(pdfs)
-    if not docs:
-        return None
-
-    chunks = split_docs(docs)
-    vs = FAISS.from_documents(chunks, embeddings)
-    os.makedirs(VECTORSTORE_DIR, exist_ok=True)
-    vs.save_local(VECTORSTORE_DIR)
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump({"built_at": datetime.now().isoformat(timespec="seconds"), "pdf_files": pdfs}, f, indent=2)
-    return vs
-
-def make_chain(vectorstore, api_key: str):
-    llm = ChatOpenAI(temperature=TEMPERATURE, model=MODEL_NAME, api_key=api_key)
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+    """Shared index if one is published; otherwise start a background build and return None."""
+    if kb_exists():
+        return get_shared_vectorstore(api_key)
+    # first build runs off the script thread; a failed folder state is retried only with backoff
+    staleness = kb_staleness()
+    if staleness["signature"]:
+        index_builder.start(api_key, key=staleness["signature"])
+    return None
+
+def refresh_stale_index(api_key: str) -> None:
+    """Start a background incremental update when the PDF folder no longer matches the index."""
+    staleness = kb_staleness()
+    # an empty folder never triggers: that would wipe a published index shipped without its PDFs
+    if staleness["stale"] and staleness["signature"]:
+        index_builder.start(api_key, key=staleness["signature"])
+
+def indexing_message(status: dict) -> str:
+    if status["stage"] == "waiting":
+        return "⏳ Indexing the knowledge base — another worker is building it; this session will reuse its result."
+    parts = [f"{status['pages_parsed']:,} pages parsed ({status['files_done']}/{status['files_total']} PDFs)"]
+    if status["chunks_total"]:
+        parts.append(f"{status['chunks_embedded']:,}/{status['chunks_total']:,} chunks embedded")
+    if status["eta_s"] is not None:
+        parts.append(f"~{status['eta_s']:.0f}s left in this step")
+    return "⏳ Indexing the knowledge base — " + ", ".join(parts) + "."
+
+def page_spans_text(spans) -> str:
+    """[[1, 3], [5, 5]] -> "1–3, 5"."""
+    return ", ".join(f"{first}–{last}" if first != last else f"{first}" for first, last in spans)
+
+def image_only_message(image_only: dict) -> str:
+    return ("Image-only pages (scans or drawings without a text layer) are not searchable:\n\n"
+            + "\n".join(f"• **{name}** — pages {page_spans_text(spans)}" for name, spans in image_only.items()))
+
+def skipped_pages_text(entry: dict) -> str:
+    # a whole file that failed has no page range, just the reason
+    if not entry["pages"]:
+        return entry["reason"]
+    first, last = entry["pages"]
+    return (f"pages {first}–{last}" if first != last else f"page {first}") + f": {entry['reason']}"
+
+def quarantine_message(quarantined: dict) -> str:
+    return "Some pages were left out of the index:\n\n" + "\n".join(
+        f"• **{name}** — " + "; ".join(skipped_pages_text(e) for e in entries)
+        for name, entries in quarantined.items())
+
+def make_chain(vectorstore, api_key: str, memory=None):
+    llm = get_llm(api_key)
+    if memory is None:
+        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
     return ConversationalRetrievalChain.from_llm(
         llm=llm,
         retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
@@ -142,18 +144,36 @@ def get_api_key() -> str:
     return key.strip()
 
 def ensure_conversation():
-    """Initialize RAG chain when possible."""
-    if st.session_state.get("conversation"):
-        return
+    """Initialize RAG chain when possible; rebind it if the shared index was reloaded."""
+    convo = st.session_state.get("conversation")
+    # taken before loading: if a publish races with us, the next rerun just rebinds again
+    fingerprint = kb_fingerprint()
     api_key = get_api_key()
+    if api_key and kb_exists():
+        refresh_stale_index(api_key)  # stat-only; the current index keeps serving meanwhile
+    if convo and st.session_state.get("vs_fingerprint") == fingerprint:
+        return
     if not api_key:
         st.session_state["rag_status"] = "missing_key"
         return
-    vs = build_or_load_vectorstore(api_key)
+    try:
+        vs = build_or_load_vectorstore(api_key)
+    except EmbeddingMismatch as e:
+        # refresh_stale_index() above has already started the re-embed if there are PDFs
+        st.session_state["rag_status"] = "indexing" if index_builder.running() else "embedding_mismatch"
+        st.session_state["rag_error"] = str(e)
+        return
     if vs is None:
-        st.session_state["rag_status"] = "no_pdfs"
+        if index_builder.running():
+            st.session_state["rag_status"] = "indexing"
+        elif index_builder.error:
+            st.session_state["rag_status"] = "build_failed"
+        else:
+            st.session_state["rag_status"] = "no_pdfs"
         return
-    st.session_state["conversation"] = make_chain(vs, api_key)
+    memory = convo.memory if convo else None  # keep the chat history across an index swap
+    st.session_state["conversation"] = make_chain(vs, api_key, memory=memory)
+    st.session_state["vs_fingerprint"] = fingerprint
     st.session_state["rag_status"] = "ready"
 
 def tidy_response(text: str) -> str:
@@ -302,6 +322,11 @@ tab_chat, tab_photos, tab_kb, tab_references, tab_settings = st.tabs(
 with tab_chat:
     # RAG auto-init
     ensure_conversation()
+    if st.session_state.get("rag_status") == "indexing":
+        build = index_builder.status()
+        st.info(indexing_message(build) + " You can keep this tab open; answers start once it's ready.")
+        if build["fraction"] is not None:
+            st.progress(build["fraction"])
     
     # Scrollable chat messages container
     st.markdown('<div class="app-card" style="padding:20px;">', unsafe_allow_html=True)
@@ -461,7 +486,16 @@ if submitted and q.strip():
         if status == "missing_key":
             answer = "⚠️ RAG unavailable: Please set your OPENAI_API_KEY in the Settings tab."
         elif status == "no_pdfs":
-            answer = "⚠️ RAG unavailable: Please add PDFs in the Knowledge Base tab and rebuild the index."
+            answer = "⚠️ RAG unavailable: Please add PDFs to the knowledge folder; they are indexed automatically."
+        elif status == "indexing":
+            answer = indexing_message(index_builder.status()) + " Please ask again once indexing finishes."
+        elif status == "build_failed":
+            answer = f"⚠️ RAG unavailable: building the knowledge base failed ({index_builder.error})."
+            retry = index_builder.retry_in()
+            if retry is not None:
+                answer += f" It is retried automatically in {retry:.0f} s."
+        elif status == "embedding_mismatch":
+            answer = f"⚠️ RAG unavailable: {st.session_state.get('rag_error')}."
         else:
             answer = "⚠️ RAG not ready. Please check Settings and Knowledge Base."
     formatted = tidy_response(answer)
@@ -556,15 +590,45 @@ with tab_photos:
 with tab_kb:
     st.markdown('<div class="app-card" style="padding:20px;">', unsafe_allow_html=True)
     st.subheader("Knowledge Base")
-    st.caption("PDFs in the app folder are indexed for retrieval.")
+    st.caption(f"PDFs under `{os.path.abspath(KNOWLEDGE_DIR)}` (including subfolders) are indexed for retrieval.")
 
-    pdfs = list_pdfs_in_cwd()
+    pdfs = list_pdfs()
     if not pdfs:
-        st.info("No PDF files found in the app folder.")
+        st.info("No PDF files found in the knowledge folder.")
     else:
         for f in pdfs:
             size_kb = os.path.getsize(f) / 1024
-            st.markdown(f"• **{f}** — {size_kb:,.1f} KB")
+            shard = f" · shard: {shard_of(f)}" if KB_SHARDED else ""
+            st.markdown(f"• **{doc_name(f)}** — {size_kb:,.1f} KB{shard}")
+
+    if kb_exists():
+        staleness = kb_staleness()
+        if index_builder.running():
+            st.info(indexing_message(index_builder.status()))
+        elif staleness["stale"]:
+            changes = [f"{label}: {', '.join(staleness[k])}" for k, label in
+                       (("new", "new"), ("modified", "modified"), ("deleted", "removed")) if staleness[k]]
+            changes += [f"{what} settings changed" for k, what in
+                        (("embedding_changed", "embedding"), ("chunking_changed", "chunking")) if staleness[k]]
+            note = ("" if staleness["signature"] else
+                    " No PDFs are in the folder, so the published index is kept as is.")
+            st.warning("Index is out of date with the PDF folder — " + "; ".join(changes) + "." + note)
+        else:
+            st.success("Index is up to date with the PDF folder.")
+
+        image_only = kb_image_only()
+        if image_only:
+            st.info(image_only_message(image_only))
+
+        quarantined = kb_quarantined()
+        if quarantined:
+            st.warning(quarantine_message(quarantined))
+            if st.button("Retry skipped pages with longer time limits", disabled=index_builder.running()):
+                api_key = get_api_key()
+                if not api_key:
+                    st.error("Set OPENAI_API_KEY in Settings first.")
+                elif index_builder.start(api_key, retry_quarantined=True):
+                    st.rerun()
 
     # c1, c2 = st.columns(2)
     # with c1:
@@ -573,14 +637,13 @@ with tab_kb:
     #         if not api_key:
     #             st.error("Set OPENAI_API_KEY in Settings first.")
     #         else:
-    #             # clean old vs to force rebuild
-    #             if os.path.isdir(VECTORSTORE_DIR):
-    #                 shutil.rmtree(VECTORSTORE_DIR, ignore_errors=True)
-    #             vs = build_or_load_vectorstore(api_key)
-    #             if vs:
-    #                 st.session_state.conversation = make_chain(vs, api_key)
-    #                 st.session_state.rag_status = "ready"
-    #                 st.success("Knowledge base rebuilt.")
+    #             # re-embeds only new/changed PDFs and drops vectors of deleted ones
+    #             reports = update_knowledge_base(api_key, warn=st.warning)
+    #             if kb_exists():
+    #                 ensure_conversation()
+    #                 st.success(f"Knowledge base updated: {sum(len(r['new']) for r in reports.values())} new, "
+    #                            f"{sum(len(r['changed']) for r in reports.values())} changed, "
+    #                            f"{sum(len(r['deleted']) for r in reports.values())} removed.")
     #             else:
     #                 st.error("No PDFs found or failed to build vectorstore.")
     # with c2:
@@ -589,11 +652,10 @@ with tab_kb:
     #         st.success("Cleared.")
 
     # Vectorstore metadata
-    if os.path.exists(METADATA_PATH):
+    meta = kb_manifest()
+    if meta:
         st.divider()
         st.caption("Index metadata")
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            meta = json.load(f)
         st.json(meta)
 
     st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,143 @@
+"""Index size, search latency and recall@3 of shortened text-embedding-3 vectors on our PDFs.
+
+    python benchmarks/embedding_dims.py --dims 256 512 1024 1536
+
+Chunks the PDFs in KNOWLEDGE_DIR the way the app does and embeds them once
+at the model's full size. Shorter sizes are derived by truncating and re-normalizing,
+which is what the API's `dimensions` parameter returns for text-embedding-3 models;
+pass --api to request every size from the API instead (one full re-embed per size).
+Ground truth is the full-size top-3, i.e. what the app retrieves today. Needs
+OPENAI_API_KEY; embeddings are cached in --cache so reruns cost nothing.
+
+    python benchmarks/embedding_dims.py --from-index vectorstore [--queries 100]
+
+reuses the full-size vectors of a built index instead (no API key, no PDFs): a
+random --queries of its chunks are held out and stand in for the questions.
+
+Measured with --from-index on the shipped vectorstore (853 chunks: 753 indexed,
+100 held out; flat index; 1 CPU, faiss-cpu 1.15.1):
+
+     dims   MB   ms/query  recall@3
+      256  0.74   0.020     0.833
+      512  1.47   0.044     0.867
+     1024  2.94   0.147     0.927
+     1536  4.41   0.146     1.000
+
+Held-out chunks come from the same text as the corpus, so real questions may
+recall differently.
+"""
+
+import argparse, os, sys
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from faiss_index import all_vectors, build_index, choose_index_type
+from index_types import recall_at_k, timed_search
+from knowledge_base import (
+    NATIVE_DIMENSIONS, current_index_dir, get_embeddings, list_pdfs, load_docs_from_files, split_docs,
+)
+from snapshot import SNAPSHOT_FILE
+
+QUESTIONS = [
+    "What are the types of shallow foundations?",
+    "How is the bearing capacity of a spread footing calculated?",
+    "When should drilled shafts be chosen over driven piles?",
+    "What factors control the settlement of a mat foundation?",
+    "How do you design a dewatering system for an excavation?",
+    "What is the cone of depression around a pumping well?",
+    "How does frost heave affect foundations in cold regions?",
+    "What is permafrost and how do you build on it?",
+    "How is pile capacity verified in the field?",
+    "What is negative skin friction on piles?",
+    "How deep should a footing be placed below the frost line?",
+    "What soil investigations are needed before foundation design?",
+    "How does groundwater affect bearing capacity?",
+    "What are common causes of foundation failure?",
+    "How are wellpoints used for construction dewatering?",
+    "What is the difference between end bearing and friction piles?",
+]
+
+
+def shorten(x: np.ndarray, dim: int) -> np.ndarray:
+    x = np.ascontiguousarray(x[:, :dim])
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def embed(texts, api_key, dim):
+    return np.asarray(get_embeddings(api_key, dim).embed_documents(texts), dtype="float32")
+
+
+def stored_vectors(path: str) -> np.ndarray:
+    path = current_index_dir(path)
+    if os.path.exists(os.path.join(path, SNAPSHOT_FILE)):
+        return np.load(os.path.join(path, "vectors.npy"))
+    return all_vectors(faiss.read_index(os.path.join(path, "index.faiss")))  # pre-snapshot build
+
+
+def index_mb(index, vectors) -> float:
+    # a flat snapshot is just vectors.npy; other kinds add index.faiss beside it
+    size = vectors.nbytes
+    if choose_index_type(len(vectors)) != "flat":
+        size += len(faiss.serialize_index(index))
+    return size / 2**20
+
+
+def load_or_embed(args):
+    args.api_key = os.getenv("OPENAI_API_KEY", "").strip()
+    if not args.api_key:
+        sys.exit("OPENAI_API_KEY is required (or use --from-index)")
+    pdfs = list_pdfs()
+    if not pdfs:
+        sys.exit("No PDFs in the knowledge directory")
+    args.texts = [c.page_content for c in split_docs(load_docs_from_files(pdfs))]
+
+    if os.path.exists(args.cache) and not args.api:
+        cached = np.load(args.cache)
+        chunks, queries = cached["chunks"], cached["queries"]
+    else:
+        chunks = embed(args.texts, args.api_key, NATIVE_DIMENSIONS)
+        queries = embed(QUESTIONS, args.api_key, NATIVE_DIMENSIONS)
+        np.savez(args.cache, chunks=chunks, queries=queries)
+    print(f"{len(pdfs)} PDFs, {len(args.texts)} chunks, {len(QUESTIONS)} questions, "
+          f"index: {choose_index_type(len(args.texts))}")
+    return chunks, queries
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dims", type=int, nargs="+", default=[256, 512, 1024, NATIVE_DIMENSIONS])
+    ap.add_argument("--api", action="store_true", help="embed at every size via the API instead of truncating")
+    ap.add_argument("--cache", default=os.path.join(ROOT, "benchmarks", ".embeddings.npz"))
+    ap.add_argument("--from-index", metavar="DIR", help="use a built index's vectors; no API calls")
+    ap.add_argument("--queries", type=int, default=100, help="held-out chunks used as queries with --from-index")
+    args = ap.parse_args()
+    if args.api and args.from_index:
+        ap.error("--api re-embeds the PDFs; it can't be combined with --from-index")
+
+    if args.from_index:
+        vectors = stored_vectors(args.from_index)
+        held_out = np.random.default_rng(0).permutation(len(vectors))
+        queries, chunks = vectors[held_out[:args.queries]], vectors[held_out[args.queries:]]
+        print(f"{len(vectors)} stored vectors: {len(chunks)} indexed, {len(queries)} held out as queries, "
+              f"index: {choose_index_type(len(chunks))}")
+    else:
+        chunks, queries = load_or_embed(args)
+
+    truth, _ = timed_search(build_index(chunks, "flat", "none"), queries)
+    print(f"{'dims':>5} {'MB':>8} {'ms/query':>9} {'recall@3':>9}")
+    for dim in args.dims:
+        if args.api and dim != NATIVE_DIMENSIONS:
+            data, q = embed(args.texts, args.api_key, dim), embed(QUESTIONS, args.api_key, dim)
+        else:
+            data, q = shorten(chunks, dim), shorten(queries, dim)
+        index = build_index(data, choose_index_type(len(data)), "none")
+        found, ms = timed_search(index, q)
+        print(f"{dim:>5} {index_mb(index, data):8.2f} {ms:9.3f} {recall_at_k(found, truth):9.3f}")
+
+
+if __name__ == "__main__":
+    main()
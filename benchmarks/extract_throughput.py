@@ -0,0 +1,63 @@
+"""PDF text extraction throughput (pages/s) by worker count.
+
+    python benchmarks/extract_throughput.py --workers 1 2 4 8 [--dir path/to/pdfs] [--repeat 3]
+
+Extracts every PDF under --dir, subfolders included (default: KNOWLEDGE_DIR, the
+corpus the app indexes) with pdf_extract.extract_pdfs at each worker count.
+--repeat lists the files several times to give small folders enough pages to
+spread over the pool. Page counts and text must match the single-worker run,
+which is checked.
+
+Measured on a 1-CPU machine only, so these numbers show the pool's overhead, not
+its scaling; the multi-core speedup has not been measured. Four PDFs (three text,
+one mixed text/image/blank; 78 pages):
+
+    workers  seconds  pages/s  speedup
+          1     5.15     15.2     1.00
+          4    12.52      6.2     0.41
+          1     7.89     29.7     1.00   (--repeat 3, 234 pages)
+          2    11.83     19.8     0.67   (--repeat 3, 234 pages)
+
+Output matched the single-worker run in every case. With KB_EXTRACT_WORKERS unset
+the pool size is os.cpu_count(), so such a host extracts with one worker.
+"""
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from knowledge_base import KNOWLEDGE_DIR, list_pdfs
+from pdf_extract import PAGES_PER_TASK, extract_pdfs
+
+
+def run(pdfs, workers, pages_per_task):
+    t0 = time.perf_counter()
+    results = list(extract_pdfs(pdfs, workers=workers, pages_per_task=pages_per_task))
+    return results, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default=KNOWLEDGE_DIR)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    ap.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+
+    pdfs = list_pdfs(args.dir)
+    if not pdfs:
+        sys.exit(f"No PDFs in {args.dir}")
+    pdfs = pdfs * args.repeat
+
+    baseline, base_s = run(pdfs, 1, args.pages_per_task)
+    pages = sum(r.n_pages for r in baseline)
+    failed = [r.pdf for r in baseline if r.error]
+    print(f"{len(pdfs)} files, {pages} pages, {len(failed)} unreadable")
+    print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'speedup':>7}")
+    for workers in args.workers:
+        results, secs = (baseline, base_s) if workers == 1 else run(pdfs, workers, args.pages_per_task)
+        assert [r.pages for r in results] == [r.pages for r in baseline], "output differs from 1 worker"
+        print(f"{workers:>7} {secs:8.2f} {pages / secs:8.1f} {base_s / secs:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Recall@3, query latency and build time of HNSW / IVF against the exact flat index.
+
+Vectors are synthetic: unit-normalized points around random cluster centres, which
+is closer to text-embedding neighbourhoods than uniform noise. Ground truth is the
+flat index's top-3.
+
+    python benchmarks/index_types.py --sizes 10000 100000 1000000 --dim 1536
+
+1M x 1536 float32 is ~6 GB per copy; pass a smaller --dim to run on a laptop.
+
+Measured with --sizes 20000 100000 --dim 384 --queries 500 on 1 CPU, faiss-cpu 1.15.1:
+
+            n  index        param  build s  ms/query  recall@3
+        20000   flat            -     0.01     0.937     1.000
+        20000   hnsw  efSearch=16     3.84     0.055     0.412
+        20000   hnsw  efSearch=64     3.84     0.169     0.743
+        20000   hnsw efSearch=128     3.84     0.300     0.879
+        20000    ivf     nprobe=8     3.80     0.084     0.904
+        20000    ivf    nprobe=16     3.80     0.118     0.975
+        20000    ivf    nprobe=32     3.80     0.202     0.995
+       100000   flat            -     0.12     4.332     1.000
+       100000   hnsw  efSearch=16    21.97     0.097     0.183
+       100000   hnsw  efSearch=64    21.97     0.263     0.379
+       100000   hnsw efSearch=128    21.97     0.424     0.527
+       100000    ivf     nprobe=8    63.84     0.218     0.827
+       100000    ivf    nprobe=16    63.84     0.364     0.939
+       100000    ivf    nprobe=32    63.84     0.611     0.989
+       100000    ivf    nprobe=64    63.84     1.159     0.998
+
+and with --sizes 200000 --ef-search 64 128 256 --nprobe 16 32 64:
+
+       200000   flat            -     0.33     8.174     1.000
+       200000   hnsw  efSearch=64    46.70     0.229     0.259
+       200000   hnsw efSearch=128    46.70     0.368     0.347
+       200000   hnsw efSearch=256    46.70     0.743     0.485
+       200000    ivf    nprobe=16   169.40     0.362     0.921
+       200000    ivf    nprobe=32   169.40     0.621     0.977
+       200000    ivf    nprobe=64   169.40     1.181     0.993
+
+HNSW recall is poor on these synthetic vectors (high intrinsic dimension) and raising
+efSearch to 256 does not fix it, so "auto" never picks HNSW. IVF at nprobe 32 (the
+default) keeps recall@3 at 0.98-0.99 while running 7-13x faster than flat from 100k
+vectors, which is where auto switches to it.
+"""
+
+import argparse, os, sys, time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from faiss_index import build_index, set_search_params
+
+K = 3
+
+
+def synthetic(n, dim, rng, clusters=256):
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    x = centres[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def recall_at_k(found, truth):
+    return np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)])
+
+
+def timed_search(index, queries):
+    t0 = time.perf_counter()
+    _, found = index.search(queries, K)
+    return found, (time.perf_counter() - t0) / len(queries) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'n':>9} {'index':>6} {'param':>12} {'build s':>8} {'ms/query':>9} {'recall@3':>9}")
+    for n in args.sizes:
+        data = synthetic(n, args.dim, rng)
+        queries = synthetic(args.queries, args.dim, rng)
+
+        t0 = time.perf_counter()
+        flat = build_index(data, "flat")
+        flat_build = time.perf_counter() - t0
+        truth, flat_ms = timed_search(flat, queries)
+        print(f"{n:>9} {'flat':>6} {'-':>12} {flat_build:8.2f} {flat_ms:9.3f} {1.0:9.3f}")
+        del flat
+
+        for kind, knob, values in (("hnsw", "efSearch", args.ef_search), ("ivf", "nprobe", args.nprobe)):
+            t0 = time.perf_counter()
+            index = build_index(data, kind)
+            build = time.perf_counter() - t0
+            for v in values:
+                set_search_params(index, ef_search=v, nprobe=v)
+                found, ms = timed_search(index, queries)
+                print(f"{n:>9} {kind:>6} {f'{knob}={v}':>12} {build:8.2f} {ms:9.3f} {recall_at_k(found, truth):9.3f}")
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Size and recall@3 of scalar/product-quantized indexes, with and without exact re-ranking.
+
+    python benchmarks/quantization.py --n 100000 --dim 1536
+
+"codes MB" is the serialized faiss index (what index.faiss holds, and what has to
+stay resident). A quantized build also writes its re-rank vectors to vectors.npy at
+RERANK_DTYPE; they are memory-mapped at serve time and only candidate rows are read.
+"disk MB" is both together and "x smaller" compares it with plain float32 vectors.
+
+Measured with --n 50000 --dim 384 --queries 500 on 1 CPU, faiss-cpu 1.15.1, float16
+re-rank vectors ("rerank Nk" re-scores N candidates per hit):
+
+    index  quant  rerank  codes MB  disk MB  x smaller  ms/query  recall@3
+     flat   none       -      73.2     73.2        1.0     1.740     1.000
+     flat    sq8     off      18.3     54.9        1.3     3.024     0.957
+     flat    sq8      8k      18.3     54.9        1.3     3.115     0.998
+     flat     pq     off       5.0     41.6        1.8     1.882     0.260
+     flat     pq     16k       5.0     41.6        1.8     2.094     0.802
+     hnsw   none       -      86.2     86.2        0.8     0.183     0.520
+     hnsw    sq8      8k      31.3     67.9        1.1     0.356     0.520
+      ivf   none       -      74.9     74.9        1.0     0.138     0.961
+      ivf    sq8     off      20.0     56.6        1.3     0.090     0.940
+      ivf    sq8      8k      20.0     56.6        1.3     0.169     0.959
+      ivf     pq     off       6.7     43.3        1.7     0.267     0.527
+      ivf     pq      8k       6.7     43.3        1.7     0.370     0.936
+
+With re-ranking the total on disk shrinks only 1.3-1.8x; the 4-15x saving is in what
+stays resident, since a query pages in just its candidates' rows of vectors.npy.
+"""
+
+import argparse, os, sys, time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from faiss_index import RerankIndex, build_index
+from index_types import K, recall_at_k, synthetic, timed_search
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--kinds", nargs="+", default=["flat", "hnsw", "ivf"])
+    ap.add_argument("--rerank", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = synthetic(args.n, args.dim, rng)
+    queries = synthetic(args.queries, args.dim, rng)
+    truth, _ = timed_search(build_index(data, "flat", "none"), queries)
+    raw_mb = data.nbytes / 2**20
+
+    print(f"{'index':>6} {'quant':>5} {'rerank':>6} {'codes MB':>9} {'disk MB':>8} {'x smaller':>9} {'build s':>8} "
+          f"{'ms/query':>9} {'recall@3':>9}")
+    for kind in args.kinds:
+        for quant in ("none", "sq8", "pq"):
+            t0 = time.perf_counter()
+            index = build_index(data, kind, quant)
+            build = time.perf_counter() - t0
+            codes = index.index if isinstance(index, RerankIndex) else index
+            mb = faiss.serialize_index(codes).nbytes / 2**20
+            disk_mb = mb + (index.vectors.nbytes / 2**20 if isinstance(index, RerankIndex) else 0)
+            for factor in (args.rerank if isinstance(index, RerankIndex) else [0]):
+                if factor:
+                    index.rerank_factor = factor
+                found, ms = timed_search(index if factor != 1 else codes, queries)
+                label = "-" if not factor else ("off" if factor == 1 else f"{factor}k")
+                print(f"{kind:>6} {quant:>5} {label:>6} {mb:9.1f} {disk_mb:8.1f} {raw_mb / disk_mb:9.1f} {build:8.2f} "
+                      f"{ms:9.3f} {recall_at_k(found, truth):9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Per-session cost of opening the knowledge base: private FAISS load vs. one shared copy.
+
+Simulates N Streamlit sessions in one process and reports the RSS growth per session
+and the time until each session can answer its first retrieval.
+
+    python benchmarks/session_load.py --sessions 8
+
+Uses FakeEmbeddings unless OPENAI_API_KEY is set, so the numbers isolate index
+loading from network latency.
+
+Measured with --sessions 8 on 1 CPU, faiss-cpu 1.15.1. "later" is the mean over
+sessions 2-8; the 50k index is synthetic (random 1536-dim vectors, placeholder text)
+saved with save_local():
+
+    index                   mode         MB/session  1st session  later sessions
+    shipped (853 chunks)    per-session         6.9      90.3 ms         19.1 ms
+    shipped (853 chunks)    shared              1.0      57.2 ms          0.7 ms
+    50k x 1536              per-session       389.8    1125.6 ms       1332.7 ms
+    50k x 1536              shared             50.2    1182.4 ms         41.2 ms
+    50k x 1536, snapshot    per-session       300.7     173.0 ms         89.6 ms
+    50k x 1536, snapshot    shared             40.7     176.1 ms         39.3 ms
+
+The snapshot rows load the same vectors from a snapshot directory (user-013).
+"""
+
+import argparse, os, sys, time
+
+from langchain_community.embeddings import FakeEmbeddings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from knowledge_base import _load_faiss as load, get_embeddings
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run(mode: str, sessions: int, path: str, embeddings, query: str):
+    shared = None
+    held, first_answer = [], []
+    base = rss_mb()
+    for _ in range(sessions):
+        t0 = time.perf_counter()
+        if mode == "per-session":
+            vs = load(path, embeddings)
+        else:
+            if shared is None:
+                shared = load(path, embeddings)
+            vs = shared
+        vs.as_retriever(search_kwargs={"k": 3}).get_relevant_documents(query)
+        first_answer.append(time.perf_counter() - t0)
+        held.append(vs)  # sessions keep their store alive, as st.session_state does
+    grown = rss_mb() - base
+    print(f"{mode:>12}: {grown / sessions:8.1f} MB/session  "
+          f"first-retrieval {first_answer[0] * 1000:8.1f} ms (1st session)  "
+          f"{sum(first_answer[1:]) / max(1, sessions - 1) * 1000:8.1f} ms (later sessions)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--path", default=os.path.join(ROOT, "vectorstore"))
+    ap.add_argument("--query", default="What are the types of shallow foundations?")
+    ap.add_argument("--mode", choices=["per-session", "shared", "both"], default="both")
+    args = ap.parse_args()
+
+    key = os.getenv("OPENAI_API_KEY", "")
+    embeddings = get_embeddings(key) if key else FakeEmbeddings(size=1536)
+
+    # run each mode in a fresh interpreter so RSS numbers don't bleed into each other
+    if args.mode == "both":
+        import subprocess
+        for mode in ("per-session", "shared"):
+            subprocess.run([sys.executable, __file__, "--mode", mode, "--sessions", str(args.sessions),
+                            "--path", args.path, "--query", args.query], check=True)
+        return
+    run(args.mode, args.sessions, args.path, embeddings, args.query)
+
+
+if __name__ == "__main__":
+    main()
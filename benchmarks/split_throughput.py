@@ -0,0 +1,73 @@
+"""Chunking throughput: chunker.Splitter against LangChain's RecursiveCharacterTextSplitter.
+
+    python benchmarks/split_throughput.py [--pages 10000] [--size 1000 --overlap 200] [--tokens]
+
+Extracts the PDFs in KNOWLEDGE_DIR once, then repeats their pages until there are
+--pages page Documents (boilerplate stripped, as the build does). Both splitters
+then chunk them, best of --runs. The chunk text and metadata of the two must be
+identical, and the script checks that. --tokens measures length in KB_TOKENIZER
+tokens, like KB_CHUNK_UNIT=tokens.
+
+Measured with --pages 10000 on 1 CPU, best of 3, pages from four PDFs (three
+text-heavy, one mixed); 17.5M characters, size 1000 / overlap 200:
+
+    splitter   seconds  pages/s  chunks  speedup
+    langchain     1.21     8252  25,463     1.00
+    chunker       0.53    18759  25,463     2.27
+
+--tokens was not run (the encoding could not be fetched offline). With a whitespace
+word count as the length function, on 2,000 pages at size 256 / overlap 50, the
+chunks were identical and chunker was 1.15x faster (0.25 s vs 0.28 s): one length
+call per piece dominates there, as it would with tokens.
+"""
+
+import argparse, os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from chunker import Splitter
+from knowledge_base import list_pdfs, load_docs_from_files, tokenizer
+
+
+def best_of(runs, fn):
+    best, out = float("inf"), None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=10_000)
+    ap.add_argument("--size", type=int, default=1000)
+    ap.add_argument("--overlap", type=int, default=200)
+    ap.add_argument("--tokens", action="store_true")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    pages = load_docs_from_files(list_pdfs())
+    if not pages:
+        sys.exit("No PDF text found in KNOWLEDGE_DIR")
+    docs = (pages * (args.pages // len(pages) + 1))[:args.pages]
+    chars = sum(len(d.page_content) for d in docs)
+    print(f"{len(docs):,} pages, {chars / 2**20:.1f}M characters")
+
+    length = (lambda text: len(tokenizer().encode_ordinary(text))) if args.tokens else None
+    langchain = RecursiveCharacterTextSplitter(chunk_size=args.size, chunk_overlap=args.overlap,
+                                               **({"length_function": length} if length else {}))
+    ours = Splitter(args.size, args.overlap, length)
+    expected, base_s = best_of(args.runs, lambda: langchain.split_documents(docs))
+    got, secs = best_of(args.runs, lambda: ours.split_documents(docs))
+    assert [(c.page_content, c.metadata) for c in got] == [(c.page_content, c.metadata) for c in expected], \
+        "chunks differ from RecursiveCharacterTextSplitter"
+    print(f"{'splitter':>10} {'seconds':>8} {'pages/s':>9} {'chunks':>8} {'speedup':>7}")
+    for name, s in (("langchain", base_s), ("chunker", secs)):
+        print(f"{name:>10} {s:8.2f} {len(docs) / s:9.0f} {len(got):8,} {base_s / s:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""RSS/PSS per worker process for the heap-copy and memory-mapped FAISS load paths.
+
+Starts N worker processes that each load the index and run one search, then
+reports resident (RSS) and proportional (PSS, shared pages split between
+processes) memory per worker, plus the time to the first search.
+
+    python benchmarks/worker_rss.py --workers 4
+
+Measured with --workers 4 on 1 CPU, faiss-cpu 1.15.1 (IO_FLAG_MMAP_IFC available);
+the 50k index is synthetic (random 1536-dim vectors, placeholder text):
+
+    index                   mode        total PSS  PSS/worker  first search
+    shipped (853 chunks)    heap copy    113.5 MB     28.4 MB      49-60 ms
+    shipped (853 chunks)    mmap          98.0 MB     24.5 MB      28-42 ms
+    50k x 1536              heap copy   1804.9 MB
+    50k x 1536              mmap         925.9 MB
+    50k x 1536, snapshot    heap copy    386.3 MB     96.6 MB    372-387 ms
+    50k x 1536, snapshot    mmap         386.2 MB     96.6 MB    377-391 ms
+
+A snapshot (user-013) maps vectors.npy read-only in both modes, so its two rows
+match; each worker's PSS is mostly its quarter share of the 300 MB of vectors.
+"""
+
+import argparse, multiprocessing as mp, os, sys, time
+
+from langchain_community.embeddings import FakeEmbeddings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from knowledge_base import _load_faiss
+
+
+def mem_mb():
+    """(rss, pss) in MB from /proc; PSS falls back to RSS on kernels without smaps_rollup."""
+    vals = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                k, _, rest = line.partition(":")
+                if k in ("Rss", "Pss"):
+                    vals[k] = int(rest.split()[0]) / 1024
+    except FileNotFoundError:
+        with open("/proc/self/statm") as f:
+            vals["Rss"] = vals["Pss"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    return vals["Rss"], vals["Pss"]
+
+
+def worker(path, mmap, ready, done, out):
+    t0 = time.perf_counter()
+    vs = _load_faiss(path, FakeEmbeddings(size=1536), mmap=mmap)
+    vs.similarity_search("bearing capacity of spread footings", k=3)
+    first = time.perf_counter() - t0
+    ready.wait()  # measure only once every worker has its index loaded
+    out.put((os.getpid(), first, *mem_mb()))
+    done.wait()
+
+
+def run(path, mmap, workers):
+    ready, done = mp.Barrier(workers + 1), mp.Event()
+    out = mp.Queue()
+    procs = [mp.Process(target=worker, args=(path, mmap, ready, done, out)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    ready.wait()
+    rows = [out.get() for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    label = "mmap" if mmap else "heap copy"
+    for pid, first, rss, pss in rows:
+        print(f"{label:>9}  pid {pid:>7}  first search {first * 1000:8.1f} ms  RSS {rss:8.1f} MB  PSS {pss:8.1f} MB")
+    print(f"{label:>9}  total PSS {sum(r[3] for r in rows):8.1f} MB for {workers} workers\n")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--path", default=os.path.join(ROOT, "vectorstore"))
+    args = ap.parse_args()
+    for mmap in (False, True):
+        run(args.path, mmap, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# chunker.py — single-pass equivalent of LangChain's RecursiveCharacterTextSplitter
+# (default separators, separator kept on the following piece, whitespace stripped)
+#
+# The LangChain splitter re-splits substrings level by level, re-joins them, and
+# measures every piece two or three times. Here every piece is a contiguous (start, end)
+# span of the page text. Because the separator is kept and pieces are joined with "",
+# a chunk is just text[start:end].strip(). Each piece is measured once, and only
+# the final chunk strings are ever built. The chunks match the LangChain splitter's
+# for the same chunk_size, chunk_overlap and length function (one that gives "" length
+# 0, as characters and tokens do); tests/test_chunker.py and benchmarks/split_throughput.py
+# check that.
+
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from langchain.docstore.document import Document
+
+SEPARATORS = ("\n\n", "\n", " ", "")
+
+Span = Tuple[int, int, str]   # (start, end, chunk text); text is text[start:end], stripped
+
+
+def _cuts(text: str, start: int, end: int, sep: str) -> List[int]:
+    """Piece boundaries of text[start:end], cut before each occurrence of sep."""
+    if not sep:
+        return list(range(start, end + 1))
+    step = len(sep)
+    cuts = list(accumulate([len(part) + step for part in text[start:end].split(sep)], initial=start - step))
+    cuts[0] = start
+    if cuts[1] == start:  # an empty first piece is dropped
+        del cuts[1]
+    return cuts
+
+
+class Splitter:
+    """split(text) -> chunk spans; length_function=None measures in characters."""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int,
+                 length_function: Optional[Callable[[str], int]] = None,
+                 separators: Sequence[str] = SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
+                             f"({chunk_size}), should be smaller.")
+        self.size, self.overlap = chunk_size, chunk_overlap
+        self.length_function = length_function
+        self.separators = tuple(separators)
+
+    def split(self, text: str, start: int = 0, end: Optional[int] = None) -> List[Span]:
+        end = len(text) if end is None else end
+        out: List[Span] = []
+        if self.length_function is None and end - start < self.size:
+            self._emit(text, start, end, out)  # every piece and their sum fit: one chunk
+        else:
+            self._split(text, start, end, self.separators, out)
+        return out
+
+    def split_documents(self, docs: Iterable[Document]) -> List[Document]:
+        return [Document(page_content=chunk, metadata=dict(doc.metadata))
+                for doc in docs for _, _, chunk in self.split(doc.page_content)]
+
+    def split_pages(self, pages: Sequence[Document], joiner: str = "\n") -> List[Document]:
+        """One document's pages chunked as a single text, so page ends leave no short
+        leftover chunks and a sentence running onto the next page stays whole.
+
+        metadata["page"] is the first page a chunk draws on, metadata["pages"] [first, last].
+        """
+        starts, at = [], 0
+        for page in pages:
+            starts.append(at)
+            at += len(page.page_content) + len(joiner)
+        chunks = []
+        for start, end, chunk in self.split(joiner.join(p.page_content for p in pages)):
+            first, last = pages[bisect_right(starts, start) - 1], pages[bisect_right(starts, end - 1) - 1]
+            meta = dict(first.metadata, pages=[first.metadata.get("page"), last.metadata.get("page")])
+            chunks.append(Document(page_content=chunk, metadata=meta))
+        return chunks
+
+    def _split(self, text: str, start: int, end: int, separators: Tuple[str, ...], out: List[Span]) -> None:
+        # first separator present in the span; the ones after it are for oversized pieces
+        sep, rest = separators[-1], ()
+        for i, s in enumerate(separators):
+            if not s:
+                sep = s
+                break
+            if text.find(s, start, end) != -1:
+                sep, rest = s, separators[i + 1:]
+                break
+        cuts = _cuts(text, start, end, sep)
+        # pos[k]: measured length of the pieces before piece k (characters: the offsets)
+        if self.length_function is None:
+            pos = cuts
+        else:
+            pos = list(accumulate((self.length_function(text[a:b]) for a, b in zip(cuts, cuts[1:])), initial=0))
+        size, run = self.size, 0  # run: first piece of the current run of pieces under size
+        for k in [k for k, (a, b) in enumerate(zip(pos, pos[1:])) if b - a >= size]:
+            if run < k:
+                self._merge(text, cuts, pos, run, k, out)
+            run = k + 1
+            if rest:
+                self._split(text, cuts[k], cuts[k + 1], rest, out)
+            else:
+                out.append((cuts[k], cuts[k + 1], text[cuts[k]:cuts[k + 1]]))  # unsplittable; kept as is
+        if run < len(cuts) - 1:
+            self._merge(text, cuts, pos, run, len(cuts) - 1, out)
+
+    def _merge(self, text: str, cuts: List[int], pos: List[int], lo: int, end: int, out: List[Span]) -> None:
+        # Pieces lo..end-1 into chunks, as LangChain's _merge_splits does piece by piece:
+        # grow a chunk while it fits in size; after emitting it, drop pieces from its front
+        # until the rest fits in overlap and leaves room for the next piece. Each step is
+        # a bisect over the cumulative lengths.
+        while True:
+            hi = bisect_right(pos, pos[lo] + self.size, lo, end + 1) - 1
+            if hi >= end:
+                self._emit(text, cuts[lo], cuts[end], out)
+                return
+            self._emit(text, cuts[lo], cuts[hi], out)
+            lo = max(bisect_left(pos, pos[hi] - self.overlap, lo, hi),
+                     bisect_left(pos, pos[hi + 1] - self.size, lo, hi))
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, out: List[Span]) -> None:
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            lead = len(chunk) - len(chunk.lstrip())
+            out.append((start + lead, start + lead + len(stripped), stripped))
@@ -0,0 +1,58 @@
+# dedup.py — near-duplicate chunk detection: MinHash signatures over word shingles,
+# banded LSH for candidates, signature agreement as the Jaccard estimate
+
+import os, re, zlib
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+KB_DEDUP        = os.getenv("KB_DEDUP", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("KB_DEDUP_THRESHOLD", "0.85"))   # estimated Jaccard to fold
+SHINGLE         = 5      # words per shingle
+NUM_PERM        = 64
+BANDS           = 16     # 16 bands x 4 rows: pairs from ~0.5 Jaccard up become candidates
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240801)  # fixed, so signatures are comparable across runs
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def signature(text: str) -> np.ndarray:
+    words = re.findall(r"\w+", text.lower())
+    grams = {" ".join(words[i:i + SHINGLE]) for i in range(max(1, len(words) - SHINGLE + 1))}
+    x = np.fromiter((zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams), dtype=np.uint64, count=len(grams))
+    # values are < 2**31, so uint32 halves what a build holds per kept chunk
+    return ((np.outer(x, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """Signatures of the chunks seen so far; find() returns the key of a near-duplicate, if any."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.buckets: Dict[tuple, list] = {}
+        self.sigs: Dict[Hashable, np.ndarray] = {}
+
+    def _bands(self, sig: np.ndarray):
+        rows = NUM_PERM // BANDS
+        for b in range(BANDS):
+            yield b, sig[b * rows:(b + 1) * rows].tobytes()
+
+    def find(self, sig: np.ndarray) -> Optional[Hashable]:
+        best, best_score = None, self.threshold
+        seen = set()
+        for band in self._bands(sig):
+            for key in self.buckets.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = float(np.mean(self.sigs[key] == sig))
+                if score >= best_score:
+                    best, best_score = key, score
+        return best
+
+    def add(self, key: Hashable, sig: np.ndarray) -> None:
+        self.sigs[key] = sig
+        for band in self._bands(sig):
+            self.buckets.setdefault(band, []).append(key)
@@ -0,0 +1,270 @@
+# faiss_index.py — FAISS index construction: flat / IVF picked by corpus size (HNSW on request),
+# optionally over 8-bit scalar- or product-quantized codes
+
+import os, math
+
+import faiss
+import numpy as np
+
+INDEX_TYPES   = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "sq8", "pq")
+
+# "auto" picks by vector count: exact scan while it is cheap, IVF once a scan costs
+# several ms a query. HNSW is only built when asked for: on the benchmark vectors its
+# recall@3 stayed below 0.55 even at efSearch 256 (benchmarks/index_types.py).
+FAISS_INDEX_TYPE     = os.getenv("FAISS_INDEX_TYPE", "auto")
+IVF_MIN_VECTORS      = 100_000
+
+HNSW_M               = int(os.getenv("FAISS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH       = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE           = int(os.getenv("FAISS_IVF_NPROBE", "32"))
+
+# Quantized codes: sq8 = 1 byte/dim (4x smaller than float32), pq = 1 byte per
+# PQ_DIMS_PER_CODE dims (16x at the default). Search over-fetches RERANK_FACTOR * k
+# candidates from the codes and re-ranks them against vectors kept beside the index at
+# RERANK_DTYPE: 2 bytes/dim at float16, so sq8 + rerank is 3 bytes/dim on disk and pq
+# 2.25. Only the codes need to stay resident; a query reads its candidates' rows.
+FAISS_QUANTIZATION   = os.getenv("FAISS_QUANTIZATION", "none")
+PQ_DIMS_PER_CODE     = int(os.getenv("FAISS_PQ_DIMS_PER_CODE", "4"))
+PQ_MIN_TRAIN         = 256 * 39   # 8-bit PQ needs this many points for stable centroids
+RERANK_FACTOR        = int(os.getenv("FAISS_RERANK_FACTOR", "8"))
+RERANK_DTYPE         = os.getenv("FAISS_RERANK_DTYPE", "float16")   # or float32
+
+
+class RerankIndex:
+    """A quantized faiss index plus re-rank vectors; quacks like faiss.Index for LangChain's FAISS.
+
+    `vectors` (float16 or float32) may be a read-only np.memmap, in which case only
+    the rows of each query's candidates are paged in.
+    """
+
+    def __init__(self, index: faiss.Index, vectors: np.ndarray, rerank_factor: int = RERANK_FACTOR):
+        self.index = index
+        self.vectors = vectors
+        self.rerank_factor = rerank_factor
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def search(self, x: np.ndarray, k: int):
+        _, cand = self.index.search(x, k * self.rerank_factor)
+        D = np.full((len(x), k), np.inf, dtype="float32")
+        I = np.full((len(x), k), -1, dtype="int64")
+        for q, row in enumerate(cand):
+            row = np.sort(row[row >= 0])  # ascending rows read a memmap sequentially
+            if not len(row):
+                continue
+            dist = ((np.asarray(self.vectors[row], dtype="float32") - x[q]) ** 2).sum(axis=1)
+            order = np.argsort(dist)[:k]
+            D[q, :len(order)] = dist[order]
+            I[q, :len(order)] = row[order]
+        return D, I
+
+    def add(self, x: np.ndarray) -> None:
+        self.index.add(x)
+        self.vectors = np.vstack([self.vectors, np.asarray(x, dtype=self.vectors.dtype)])
+
+    def remove_ids(self, ids) -> int:
+        # only flat codes shift the later rows down, in step with the compacted vectors
+        if not isinstance(self.index, faiss.IndexFlatCodes):
+            raise RuntimeError("remove_ids needs a flat-codes index; rebuild from all_vectors() instead")
+        ids = np.asarray(ids, dtype="int64")
+        n = self.index.remove_ids(ids)
+        keep = np.ones(len(self.vectors), dtype=bool)
+        keep[ids] = False
+        self.vectors = self.vectors[keep]
+        return n
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.asarray(self.vectors[i], dtype="float32")
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        return np.asarray(self.vectors[i0:i0 + n], dtype="float32")
+
+
+class NumpyFlatIndex:
+    """Exact L2 search straight over a (memory-mapped) float32 array; quacks like faiss.IndexFlatL2.
+
+    Serving a flat snapshot this way skips copying vectors.npy into a faiss index:
+    the scan runs in SCAN_BLOCK-row slices, so only one slice's temporaries are live.
+    Read-only — builds load a real faiss index instead.
+    """
+
+    SCAN_BLOCK = 16_384
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self._norms = None
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def d(self) -> int:
+        return self.vectors.shape[1]
+
+    def _row_norms(self) -> np.ndarray:
+        # squared row norms, computed once (4 bytes a row) instead of on every query
+        if self._norms is None:
+            self._norms = np.concatenate([np.einsum("ij,ij->i", block, block) for block in self._blocks()]
+                                         or [np.zeros(0, dtype="float32")])
+        return self._norms
+
+    def _blocks(self):
+        for start in range(0, self.ntotal, self.SCAN_BLOCK):
+            yield np.asarray(self.vectors[start:start + self.SCAN_BLOCK])
+
+    def search(self, x: np.ndarray, k: int):
+        x = np.asarray(x, dtype="float32")
+        D = np.full((len(x), k), np.inf, dtype="float32")
+        I = np.full((len(x), k), -1, dtype="int64")
+        norms, qnorm = self._row_norms(), np.einsum("ij,ij->i", x, x)[:, None]
+        for n, block in enumerate(self._blocks()):
+            start = n * self.SCAN_BLOCK
+            dist = norms[start:start + len(block)][None, :] - 2 * (x @ block.T) + qnorm
+            rows = np.arange(start, start + len(block))[None, :].repeat(len(x), axis=0)
+            if len(block) > k:  # only the block's own top k can make the running top k
+                part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                dist, rows = np.take_along_axis(dist, part, axis=1), np.take_along_axis(rows, part, axis=1)
+            cand_D, cand_I = np.concatenate([D, dist], axis=1), np.concatenate([I, rows], axis=1)
+            top = np.argsort(cand_D, axis=1, kind="stable")[:, :k]
+            D = np.take_along_axis(cand_D, top, axis=1)
+            I = np.take_along_axis(cand_I, top, axis=1)
+        return np.maximum(D, 0).astype("float32"), I
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.asarray(self.vectors[i])
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        return np.asarray(self.vectors[i0:i0 + n])
+
+
+def _inner(index):
+    return index.index if isinstance(index, RerankIndex) else index
+
+
+def choose_index_type(n_vectors: int, requested: str = FAISS_INDEX_TYPE) -> str:
+    if requested != "auto":
+        if requested not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type {requested!r}; expected auto or one of {INDEX_TYPES}")
+        return requested
+    return "ivf" if n_vectors >= IVF_MIN_VECTORS else "flat"
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid (faiss warns below that)
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def effective_quantization(n_vectors: int, requested: str = FAISS_QUANTIZATION) -> str:
+    if requested not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {requested!r}; expected one of {QUANTIZATIONS}")
+    if n_vectors == 0:
+        return "none"
+    if requested == "pq" and n_vectors < PQ_MIN_TRAIN:
+        return "sq8"  # too few points to train 256 centroids per sub-quantizer
+    return requested
+
+
+def _new_index(kind: str, quantization: str, dim: int, n: int) -> faiss.Index:
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    pq_m = dim // PQ_DIMS_PER_CODE
+    if quantization == "pq" and dim % PQ_DIMS_PER_CODE:
+        raise ValueError(f"PQ needs the dimension ({dim}) to be a multiple of {PQ_DIMS_PER_CODE}")
+    if kind == "flat":
+        return {"none": lambda: faiss.IndexFlatL2(dim),
+                "sq8": lambda: faiss.IndexScalarQuantizer(dim, sq8),
+                "pq": lambda: faiss.IndexPQ(dim, pq_m, 8)}[quantization]()
+    if kind == "hnsw":
+        index = {"none": lambda: faiss.IndexHNSWFlat(dim, HNSW_M),
+                 "sq8": lambda: faiss.IndexHNSWSQ(dim, sq8, HNSW_M),
+                 "pq": lambda: faiss.IndexHNSWPQ(dim, pq_m, HNSW_M)}[quantization]()
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    if kind == "ivf":
+        coarse = faiss.IndexFlatL2(dim)
+        nlist = ivf_nlist(n)
+        return {"none": lambda: faiss.IndexIVFFlat(coarse, dim, nlist),
+                "sq8": lambda: faiss.IndexIVFScalarQuantizer(coarse, dim, nlist, sq8),
+                "pq": lambda: faiss.IndexIVFPQ(coarse, dim, nlist, pq_m, 8)}[quantization]()
+    raise ValueError(f"Unknown FAISS index type {kind!r}")
+
+
+def build_index(vectors: np.ndarray, kind: str, quantization: str = FAISS_QUANTIZATION):
+    """Return a populated L2 index of `kind` over `vectors` (float32, n x d).
+
+    With quantization the result is a RerankIndex holding the codes and the vectors
+    at RERANK_DTYPE.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    quantization = effective_quantization(n, quantization)
+    if n == 0:
+        kind = "flat"
+    index = _new_index(kind, quantization, dim, n)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    set_search_params(index)
+    return index if quantization == "none" else RerankIndex(index, vectors.astype(RERANK_DTYPE))
+
+
+def set_search_params(index: faiss.Index, ef_search: int = HNSW_EF_SEARCH, nprobe: int = IVF_NPROBE) -> None:
+    """Apply query-time knobs; no-op for flat indexes. These are not persisted by write_index."""
+    index = _inner(index)
+    if isinstance(index, NumpyFlatIndex):
+        return
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+
+
+def index_type(index: faiss.Index) -> str:
+    index = _inner(index)
+    if isinstance(index, NumpyFlatIndex):
+        return "flat"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+    return "flat"
+
+
+def index_quantization(index: faiss.Index) -> str:
+    index = _inner(index)
+    if isinstance(index, NumpyFlatIndex):
+        return "none"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ, faiss.IndexHNSWPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer, faiss.IndexHNSWSQ)):
+        return "sq8"
+    return "none"
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    # HNSW graphs can't drop nodes, and IVF remove_ids keeps each survivor's original id
+    # where LangChain's FAISS.delete (and RerankIndex's exact vectors) expect the rows
+    # after a removed one to shift down; only flat (quantized or not) codes do that
+    return isinstance(_inner(index), faiss.IndexFlatCodes)
+
+
+def all_vectors(index: faiss.Index) -> np.ndarray:
+    """Every stored vector in row order, as float32 (reconstructing IVF lists through a direct map)."""
+    if isinstance(index, (RerankIndex, NumpyFlatIndex)):
+        return np.asarray(index.vectors, dtype="float32")  # the re-rank copy, not decoded from the codes
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype="float32")
+    if ivf is not None:
+        ivf.make_direct_map(False)  # an array direct map would block remove_ids later
+    return vectors
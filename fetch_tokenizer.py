@@ -0,0 +1,29 @@
+"""Install step: download the chunk tokenizer's encoding into TIKTOKEN_CACHE_DIR.
+
+    python fetch_tokenizer.py
+
+Builds store every chunk's token count (metadata["tokens"]) and fail without the
+encoding (KB_TOKENIZER, o200k_base by default), so run this once per deployment on
+a host with network access. For an offline host, run it elsewhere and copy
+vectorstore/tiktoken/ across.
+"""
+
+import os, sys
+
+from dotenv import load_dotenv
+
+load_dotenv()  # KB_TOKENIZER and TIKTOKEN_CACHE_DIR may be set there
+
+from knowledge_base import TOKENIZER, tokenizer
+
+
+def main():
+    try:
+        tokenizer()
+    except RuntimeError as e:
+        sys.exit(str(e))
+    print(f"{TOKENIZER} is in {os.environ['TIKTOKEN_CACHE_DIR']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# index_builder.py — one background index build per process, pollable from any session
+
+import os, time, logging, threading
+from typing import Dict, List, Optional
+
+import openai
+
+from knowledge_base import BuildProgress, update_knowledge_base
+
+log = logging.getLogger(__name__)
+
+# A build that failed on something passing (network, rate limit, OpenAI 5xx, another
+# process holding the build lock) is retried for the same folder state, after
+# RETRY_BASE_S doubling per failure up to RETRY_MAX_S. Any other failure (bad key,
+# missing tokenizer, invalid settings) would fail the same way again, so that state
+# waits for the folder to change or for an explicit start.
+RETRY_BASE_S     = float(os.getenv("KB_BUILD_RETRY_BASE_S", "30"))
+RETRY_MAX_S      = float(os.getenv("KB_BUILD_RETRY_MAX_S", "1800"))
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+                    ConnectionError, TimeoutError)   # APITimeoutError and BuildLockTimeout included
+
+
+class IndexBuilder:
+    """Runs update_knowledge_base on a daemon thread so Streamlit reruns never block on it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.progress = BuildProgress()
+        self.warnings: List[str] = []
+        self.report: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self._last_key = None
+        self._failures = 0                       # transient failures in a row for _last_key
+        self._retry_at: Optional[float] = None   # monotonic time a failed _last_key may rerun
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def start(self, api_key: str, pdfs: Optional[List[str]] = None, key=None,
+              retry_quarantined: bool = False) -> bool:
+        """Start a build unless one is already running; returns whether this call started it.
+
+        `key` identifies the folder state being built (e.g. the staleness signature);
+        a state that was already attempted is only rerun once a transient failure's
+        backoff has passed, so a failing build doesn't restart on every rerun.
+        retry_quarantined re-extracts files that had pages quarantined (or failed)
+        with larger time budgets.
+        """
+        with self._lock:
+            if self.running():
+                return False
+            if key is not None and key == self._last_key:
+                if self._retry_at is None or time.monotonic() < self._retry_at:
+                    return False
+            else:
+                self._failures = 0
+            self._last_key, self._retry_at = key, None
+            self.progress = BuildProgress()
+            self.warnings, self.report, self.error = [], None, None
+            self._thread = threading.Thread(target=self._run, args=(api_key, pdfs, retry_quarantined),
+                                            name="index-build", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, api_key: str, pdfs: Optional[List[str]], retry_quarantined: bool) -> None:
+        try:
+            self.report = update_knowledge_base(api_key, pdfs, warn=self.warnings.append,
+                                                progress=self.progress, retry_quarantined=retry_quarantined)
+            self._failures = 0
+            self.progress.set_stage("done")
+        except Exception as e:
+            log.exception("Index build failed")
+            self.error = str(e)
+            if isinstance(e, TRANSIENT_ERRORS):
+                self._failures += 1
+                delay = min(RETRY_MAX_S, RETRY_BASE_S * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + delay
+                log.warning("Index build will be retried in %.0f s", delay)
+            self.progress.set_stage("failed")
+
+    def retry_in(self) -> Optional[float]:
+        """Seconds until a failed build may rerun for the same folder state; None if it won't."""
+        if self.running() or self._retry_at is None:
+            return None
+        return max(0.0, self._retry_at - time.monotonic())
+
+    def status(self) -> Dict:
+        return dict(self.progress.snapshot(), running=self.running(),
+                    error=self.error, retry_in_s=self.retry_in(), warnings=list(self.warnings))
+
+
+builder = IndexBuilder()
@@ -0,0 +1,81 @@
+# kb_watcher.py — polls the knowledge folder and starts a background incremental
+# reindex when PDFs are added, changed or removed; no restart, no session needed
+
+import os, time, logging, threading
+from typing import Optional
+
+from knowledge_base import doc_name, kb_staleness, list_pdfs
+from index_builder import builder as index_builder
+
+log = logging.getLogger(__name__)
+
+KB_WATCH         = os.getenv("KB_WATCH", "1") == "1"
+WATCH_INTERVAL_S = float(os.getenv("KB_WATCH_INTERVAL_S", "30"))
+
+
+def folder_signature(pdfs) -> tuple:
+    """(name, size, mtime_ns) of every PDF; stat only, no reads."""
+    out = []
+    for pdf in pdfs:
+        try:
+            s = os.stat(pdf)
+        except FileNotFoundError:  # removed between the walk and the stat
+            continue
+        out.append((doc_name(pdf), s.st_size, s.st_mtime_ns))
+    return tuple(out)
+
+
+class KnowledgeWatcher:
+    """Walks KNOWLEDGE_DIR every `interval` seconds.
+
+    A change has to look the same on two polls in a row before it counts, so a PDF
+    still being copied in isn't indexed half-written. A settled folder that differs
+    from the published index starts an incremental build on the shared IndexBuilder.
+    """
+
+    def __init__(self, interval: float = WATCH_INTERVAL_S):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_seen = None
+        self.last_poll: Optional[float] = None
+
+    def start(self, api_key: str) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(api_key,), name="kb-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self, api_key: str) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll(api_key)
+            except Exception:
+                log.exception("Knowledge folder poll failed")
+
+    def poll(self, api_key: str) -> bool:
+        """One check; returns whether it started a build."""
+        pdfs = list_pdfs()
+        signature = folder_signature(pdfs)
+        settled, self._last_seen = signature == self._last_seen, signature
+        self.last_poll = time.time()
+        # an empty folder never triggers: that would wipe a published index shipped without its PDFs
+        if not settled or not signature or index_builder.running():
+            return False
+        staleness = kb_staleness(pdfs)
+        if not staleness["stale"]:
+            return False
+        # same signature as a failed build: the builder reruns it only once a transient
+        # failure's backoff has passed, never after a deterministic one
+        started = index_builder.start(api_key, key=staleness["signature"])
+        if started:
+            log.info("Knowledge folder changed (new: %s, modified: %s, removed: %s); reindexing",
+                     staleness["new"], staleness["modified"], staleness["deleted"])
+        return started
+
+
+watcher = KnowledgeWatcher()
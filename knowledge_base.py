@@ -0,0 +1,887 @@
+# knowledge_base.py — PDF ingestion and FAISS index build/load for the chat tab
+
+import os, re, json, time, pickle, shutil, hashlib, logging, threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+import tiktoken
+from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_openai import OpenAIEmbeddings
+
+from faiss_index import (
+    FAISS_QUANTIZATION, NumpyFlatIndex, RerankIndex, all_vectors, build_index, choose_index_type,
+    effective_quantization, index_quantization, index_type, set_search_params, supports_remove,
+)
+from chunker import Splitter
+from dedup import KB_DEDUP, NearDuplicateIndex, signature
+from page_cache import PageCache
+from pdf_extract import EXTRACTOR_VERSION, extract_pdfs
+from snapshot import SNAPSHOT_FILE, open_snapshot, read_header, read_snapshot, write_snapshot
+
+log = logging.getLogger(__name__)
+
+VECTORSTORE_DIR = "vectorstore"
+# PDFs are found recursively under KNOWLEDGE_DIR (default: the working directory)
+KNOWLEDGE_DIR   = os.getenv("KNOWLEDGE_DIR", ".")
+SKIP_DIRS       = {VECTORSTORE_DIR, "__pycache__", "venv", "node_modules"}
+METADATA_FILE   = "metadata.json"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# text-embedding-3 models can return shortened vectors (e.g. 256/512/1024 of 1536).
+# The size is recorded with every build; an index is only ever queried with
+# embeddings of its own model and size, and changing it means a full re-embed.
+NATIVE_DIMENSIONS    = 1536
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(NATIVE_DIMENSIONS)))
+# Serving processes map index.faiss read-only instead of copying it into their heap,
+# so several workers on one box share the page cache. Set FAISS_MMAP=0 to disable.
+FAISS_MMAP      = os.getenv("FAISS_MMAP", "1") == "1"
+EMBED_BATCH     = 256   # chunks per embeddings request; also the progress granularity
+# Running headers/footers: a line among the first or last BOILERPLATE_ZONE non-blank
+# lines of a page that recurs (digits ignored, so page numbers match) on at least
+# BOILERPLATE_MIN_SHARE of a document's pages is stripped before chunking.
+# Chunking is recorded per build like the embedding settings: changing it re-chunks
+# and re-embeds everything, and the page cache (page_cache.py) spares re-parsing.
+# KB_CHUNK_ACROSS_PAGES=1 chunks each PDF as one continuous text instead of page by
+# page; chunks then record the pages they span in metadata["pages"].
+CHUNK_ACROSS_PAGES = os.getenv("KB_CHUNK_ACROSS_PAGES", "0") == "1"
+# KB_CHUNK_UNIT=tokens measures chunks in TOKENIZER tokens instead of characters.
+# Either way every chunk carries its token count in metadata["tokens"], so context
+# can be packed to a token budget without re-tokenizing at query time. Builds need
+# the encoding file and fail without it: fetch it once with fetch_tokenizer.py.
+CHUNK_UNIT      = os.getenv("KB_CHUNK_UNIT", "chars")
+CHUNK_SIZE      = int(os.getenv("KB_CHUNK_SIZE", "256" if CHUNK_UNIT == "tokens" else "1000"))
+CHUNK_OVERLAP   = int(os.getenv("KB_CHUNK_OVERLAP", "50" if CHUNK_UNIT == "tokens" else "200"))
+LEGACY_CHUNKING = {"size": 1000, "overlap": 200}   # builds from before it was recorded
+TOKENIZER       = os.getenv("KB_TOKENIZER", "o200k_base")   # gpt-4o-mini's encoding
+# tiktoken reads the encoding from here; fetch_tokenizer.py downloads it (from
+# openaipublic.blob.core.windows.net) as an install step, so builds run offline, and
+# an offline host can be seeded by copying the directory from one that has it
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(VECTORSTORE_DIR, "tiktoken"))
+# Pages that blow the extraction time budgets (pdf_extract.py) are quarantined; a retry
+# build re-extracts their files with budgets this many times larger.
+RETRY_BUDGET_FACTOR = 4.0
+KB_PAGE_CACHE   = os.getenv("KB_PAGE_CACHE", "1") == "1"
+PAGE_CACHE_FILE = os.path.join(VECTORSTORE_DIR, "page_cache.sqlite")
+BOILERPLATE_ZONE      = 3
+BOILERPLATE_MIN_SHARE = 0.5
+BOILERPLATE_MIN_PAGES = 3
+# Each index root (vectorstore/, or vectorstore/shards/<name>/ when sharded) keeps its
+# builds in <root>/versions/<stamp>/ and publishes one by atomically replacing
+# <root>/CURRENT, so a reader never sees a half-written index. A root without CURRENT
+# is the original flat layout and is read in place.
+KEEP_VERSIONS   = 3
+# <root>/.build.lock is held (flock) for the whole of a build, so concurrent sessions or
+# worker processes never embed twice or write the same version; the OS drops it if the
+# holder dies.
+BUILD_LOCK_TIMEOUT = float(os.getenv("KB_BUILD_LOCK_TIMEOUT", "1800"))
+
+# Topic shards (KB_SHARDED=1): each is built, published and loaded on its own, and
+# queries fan out over them (see sharded_search.py). A PDF goes to the shard whose
+# rule its path (under KNOWLEDGE_DIR) matches; no match, or several, means "general".
+KB_SHARDED    = os.getenv("KB_SHARDED", "0") == "1"
+SHARDS_DIR    = os.path.join(VECTORSTORE_DIR, "shards")
+SHARD_RULES   = {
+    "shallow":      r"shallow",
+    "deep":         r"deep|pile|drilled.?shaft|caisson",
+    "dewatering":   r"dewater|groundwater",
+    "cold_regions": r"cold.?region|frost|permafrost",
+}
+GENERAL_SHARD = "general"
+SHARD_NAMES   = tuple(SHARD_RULES) + (GENERAL_SHARD,)
+
+try:
+    import fcntl
+
+    def _try_lock(f) -> None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(f) -> None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _try_lock(f) -> None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(f) -> None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+Warn = Callable[[str], None]
+
+class BuildProgress:
+    """Counters a build updates as it goes; snapshot() is safe to call from other threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage = "starting"
+        self.files_total = self.files_done = self.pages_parsed = 0
+        self.chunks_total = self.chunks_embedded = 0
+        self.started_at = self._stage_started = time.time()
+
+    def set_stage(self, stage: str, **counts) -> None:
+        with self._lock:
+            self.stage = stage
+            self._stage_started = time.time()
+            for k, v in counts.items():
+                setattr(self, k, v)
+
+    def add(self, **deltas) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            elapsed = time.time() - self._stage_started
+            done, total = {
+                "parsing": (self.files_done, self.files_total),
+                "ingesting": (self.files_done, self.files_total),  # chunks_total grows as files come in
+                "embedding": (self.chunks_embedded, self.chunks_total),
+            }.get(self.stage, (0, 0))
+            # ETA of the current stage, extrapolated from its rate so far
+            eta = elapsed / done * (total - done) if done and total else None
+            return {
+                "stage": self.stage, "files_total": self.files_total, "files_done": self.files_done,
+                "pages_parsed": self.pages_parsed, "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded, "elapsed_s": time.time() - self.started_at,
+                "fraction": done / total if total else None, "eta_s": eta,
+            }
+
+# ---------------- Ingestion ----------------
+def list_pdfs(root: Optional[str] = None) -> List[str]:
+    """Every PDF under the knowledge directory, recursively, sorted by name."""
+    root = root or KNOWLEDGE_DIR
+    out = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".") and d not in SKIP_DIRS]
+        out.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith(".pdf"))
+    return sorted(out, key=doc_name)
+
+def doc_name(pdf: str) -> str:
+    """A PDF's name in manifests and chunk metadata: its path under the knowledge
+    directory (just the file name for PDFs at the top, as before subfolders)."""
+    return os.path.relpath(pdf, KNOWLEDGE_DIR).replace(os.sep, "/")
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def page_spans(pages: List[int]) -> List[List[int]]:
+    """[1, 2, 3, 7] -> [[1, 3], [7, 7]]"""
+    spans = []
+    for n in sorted(pages):
+        if spans and spans[-1][1] + 1 == n:
+            spans[-1][1] = n
+        else:
+            spans.append([n, n])
+    return spans
+
+def page_docs(pdf: str, pages: List[Tuple[int, str]]) -> List[Document]:
+    return [Document(page_content=text, metadata={"source": doc_name(pdf), "page": n}) for n, text in pages]
+
+def _line_key(line: str) -> str:
+    return re.sub(r"\d+", "#", " ".join(line.split())).lower()
+
+def _edge_lines(lines: List[str]) -> set:
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    zone = min(BOILERPLATE_ZONE, len(filled) // 3)  # a short page keeps its middle
+    return set(filled[:zone] + filled[len(filled) - zone:])
+
+def strip_boilerplate(docs: List[Document]) -> Tuple[List[Document], int]:
+    """Strip running headers/footers from one document's pages.
+
+    Returns the pages that still have text and the number of characters removed.
+    """
+    if len(docs) < BOILERPLATE_MIN_PAGES:
+        return docs, 0
+    pages = [d.page_content.split("\n") for d in docs]
+    counts = Counter()
+    for lines in pages:
+        counts.update({_line_key(lines[i]) for i in _edge_lines(lines)})
+    min_pages = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_SHARE * len(docs))
+    repeated = {key for key, n in counts.items() if n >= min_pages}
+    if not repeated:
+        return docs, 0
+    kept, removed = [], 0
+    for doc, lines in zip(docs, pages):
+        edges = _edge_lines(lines)
+        text = "\n".join(line for i, line in enumerate(lines) if i not in edges or _line_key(line) not in repeated)
+        removed += len(doc.page_content) - len(text)
+        doc.page_content = text
+        if text.strip():
+            kept.append(doc)
+    return kept, removed
+
+def load_docs_from_files(pdf_files, warn: Optional[Warn] = None):
+    warn = warn or log.warning
+    docs = []
+    for result in extract_pdfs(pdf_files):
+        if result.error:
+            warn(f"Could not read {result.pdf}: {result.error}")
+            continue
+        for first, last, reason in result.skipped:
+            warn(f"Skipped pages {first}-{last} of {result.pdf}: {reason}")
+        docs.extend(strip_boilerplate(page_docs(result.pdf, result.pages))[0])
+    return docs
+
+def chunking_spec() -> Dict:
+    spec = {"size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}
+    if CHUNK_UNIT == "tokens":
+        spec.update(unit="tokens", tokenizer=TOKENIZER)
+    if CHUNK_ACROSS_PAGES:
+        spec["across_pages"] = True
+    return spec
+
+_tokenizer = None
+
+def tokenizer() -> tiktoken.Encoding:
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            _tokenizer = tiktoken.get_encoding(TOKENIZER)
+        except Exception as e:  # not fetched and the download failed (offline host)
+            raise RuntimeError(f"tiktoken encoding {TOKENIZER!r} is not in {os.environ['TIKTOKEN_CACHE_DIR']} "
+                               f"and could not be downloaded ({e}). Run `python fetch_tokenizer.py` on a host "
+                               f"with network access, or copy that directory from one.") from e
+    return _tokenizer
+
+def count_tokens(texts: List[str]) -> List[int]:
+    # encode_ordinary: PDF text that happens to contain "<|endoftext|>" is just text
+    return [len(t) for t in tokenizer().encode_ordinary_batch(texts)]
+
+def split_docs(docs):
+    # same chunks as LangChain's RecursiveCharacterTextSplitter, in one pass (chunker.py)
+    length = (lambda text: len(tokenizer().encode_ordinary(text))) if CHUNK_UNIT == "tokens" else None
+    splitter = Splitter(CHUNK_SIZE, CHUNK_OVERLAP, length)
+    if CHUNK_ACROSS_PAGES:
+        chunks = [chunk for _, pages in groupby(docs, key=lambda d: d.metadata.get("source"))
+                  for chunk in splitter.split_pages(list(pages))]
+    else:
+        chunks = splitter.split_documents(docs)
+    for chunk, n in zip(chunks, count_tokens([c.page_content for c in chunks])):
+        chunk.metadata["tokens"] = n
+    return chunks
+
+def _source_ref(doc: Document) -> Dict:
+    return {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+
+class DuplicateFolder:
+    """Drops chunks that near-duplicate an indexed chunk or one kept earlier in the build.
+
+    Files are fed one at a time, so it works on a stream. The chunk that is kept
+    lists every (source, page) it stands for in metadata["sources"].
+    """
+
+    def __init__(self, indexed: Dict[str, Document]):
+        self.seen = NearDuplicateIndex()
+        self.canonical = {}
+        self.dropped = 0
+        for key, doc in indexed.items():
+            self._keep(key, doc, signature(doc.page_content))
+
+    def _keep(self, key, doc: Document, sig) -> None:
+        self.seen.add(key, sig)
+        self.canonical[key] = doc
+
+    def fold(self, name: str, chunks: List[Document]) -> Tuple[List[Document], List[str]]:
+        """(chunks to index, other files now holding this file's dropped chunks)."""
+        kept, holders = [], set()
+        for n, chunk in enumerate(chunks):
+            sig = signature(chunk.page_content)
+            match = self.seen.find(sig)
+            if match is None:
+                self._keep((name, n), chunk, sig)
+                kept.append(chunk)
+                continue
+            doc = self.canonical[match]
+            sources = doc.metadata.setdefault("sources", [_source_ref(doc)])
+            if _source_ref(chunk) not in sources:
+                sources.append(_source_ref(chunk))
+            if doc.metadata.get("source") != name:
+                holders.add(doc.metadata.get("source"))
+            self.dropped += 1
+        return kept, sorted(holders)
+
+def _drop_sources(docs, names: set) -> None:
+    """Forget folded-in copies from files that are leaving the index."""
+    for doc in docs:
+        sources = doc.metadata.get("sources")
+        if sources:
+            sources[:] = [s for s in sources if s["source"] not in names]
+            if len(sources) <= 1:
+                del doc.metadata["sources"]
+
+# ---------------- Index ----------------
+class EmbeddingMismatch(ValueError):
+    pass
+
+def embedding_spec(dimensions: int = EMBEDDING_DIMENSIONS) -> Dict:
+    return {"model": EMBEDDING_MODEL, "dimensions": dimensions}
+
+def manifest_embedding(manifest: Dict) -> Dict:
+    # builds from before the setting existed used the model's full size
+    return manifest.get("embedding", embedding_spec(NATIVE_DIMENSIONS))
+
+def get_embeddings(api_key: str, dimensions: int = EMBEDDING_DIMENSIONS) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=api_key, dimensions=dimensions)
+
+def check_embeddings(vs: FAISS, embeddings, path: str) -> None:
+    """Refuse to serve an index with query embeddings of another model or size."""
+    expected = {"model": getattr(embeddings, "model", None), "dimensions": getattr(embeddings, "dimensions", None)}
+    built = dict(manifest_embedding(read_manifest(os.path.join(path, METADATA_FILE))), dimensions=vs.index.d)
+    for k, want in expected.items():
+        if want is not None and built[k] != want:
+            raise EmbeddingMismatch(
+                f"Index at {path} was built with {built['model']} at {built['dimensions']} dimensions, "
+                f"but queries use {expected['model']} at {expected['dimensions']}; rebuild it or set "
+                f"EMBEDDING_DIMENSIONS={built['dimensions']}")
+
+def _mmap_flags() -> int:
+    # IO_FLAG_MMAP maps IVF inverted lists; newer faiss builds also expose
+    # IO_FLAG_MMAP_IFC, which maps the codes of flat/SQ/PQ indexes too.
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+def _load_faiss(path: str, embeddings: OpenAIEmbeddings, mmap: bool = False, writable: bool = False) -> FAISS:
+    vs = _read_faiss(path, embeddings, mmap=mmap, writable=writable)
+    check_embeddings(vs, embeddings, path)
+    set_search_params(vs.index)  # efSearch / nprobe aren't stored in index.faiss
+    return vs
+
+def _read_faiss(path: str, embeddings: OpenAIEmbeddings, mmap: bool = False, writable: bool = False) -> FAISS:
+    """Load an index directory.
+
+    Directories written by save_vectorstore() are snapshots (see snapshot.py): nothing
+    is unpickled, vectors and chunk columns are memory-mapped, and a flat index is
+    searched straight off vectors.npy. mmap=True also maps index.faiss read-only;
+    writable=True materializes everything so the store can take add/delete.
+    Older builds fall back to save_local()'s index.faiss + index.pkl.
+    """
+    if os.path.exists(os.path.join(path, SNAPSHOT_FILE)):
+        return _read_snapshot(path, embeddings, mmap=mmap, writable=writable)
+    if mmap and not writable:
+        index = faiss.read_index(os.path.join(path, "index.faiss"), _mmap_flags())
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+    try:
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    except TypeError:
+        return FAISS.load_local(path, embeddings)
+
+def _read_snapshot(path: str, embeddings: OpenAIEmbeddings, mmap: bool, writable: bool) -> FAISS:
+    info = read_header(path)["index"]
+    if writable:
+        vectors, docs, index_to_docstore_id = read_snapshot(path)
+        docstore = InMemoryDocstore(docs)
+    else:
+        vectors, docstore, index_to_docstore_id = open_snapshot(path)
+    if info["file"] is None:
+        # plain flat: the vectors are the index
+        index = build_index(vectors, "flat", "none") if writable else NumpyFlatIndex(vectors)
+    else:
+        index = faiss.read_index(os.path.join(path, info["file"]), _mmap_flags() if mmap and not writable else 0)
+        if info["quantization"] != "none":
+            index = RerankIndex(index, vectors)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def embed_chunks(chunks: List[Document], embeddings: OpenAIEmbeddings,
+                 progress: Optional[BuildProgress] = None) -> np.ndarray:
+    """Embed in EMBED_BATCH requests so progress can be reported between them."""
+    out = []
+    for i in range(0, len(chunks), EMBED_BATCH):
+        batch = chunks[i:i + EMBED_BATCH]
+        out.extend(embeddings.embed_documents([c.page_content for c in batch]))
+        if progress:
+            progress.add(chunks_embedded=len(batch))
+    return np.asarray(out, dtype="float32").reshape(len(out), -1)
+
+def _new_faiss(chunks: List[Document], ids: List[str], embeddings: OpenAIEmbeddings, vectors: np.ndarray,
+               kind: str, quantization: str = FAISS_QUANTIZATION) -> FAISS:
+    """Like FAISS.from_documents, but with the index type chosen by faiss_index."""
+    index = build_index(vectors, kind, quantization)
+    return FAISS(embeddings, index, InMemoryDocstore(dict(zip(ids, chunks))), dict(enumerate(ids)))
+
+def _append(vs: FAISS, chunks: List[Document], ids: List[str], vectors: np.ndarray) -> None:
+    """vs.add_embeddings() without round-tripping the vectors through Python lists."""
+    start = vs.index.ntotal
+    vs.index.add(np.ascontiguousarray(vectors, dtype="float32"))
+    vs.docstore.add(dict(zip(ids, chunks)))
+    vs.index_to_docstore_id.update({start + n: i for n, i in enumerate(ids)})
+
+def _embed_into(staged: Optional[FAISS], chunks: List[Document], ids: List[str],
+                embeddings: OpenAIEmbeddings, progress: BuildProgress) -> FAISS:
+    vectors = embed_chunks(chunks, embeddings, progress)
+    if staged is None:
+        return _new_faiss(chunks, ids, embeddings, vectors, "flat", "none")
+    _append(staged, chunks, ids, vectors)
+    return staged
+
+def _reindex(vs: FAISS, kind: str, quantization: str = FAISS_QUANTIZATION) -> None:
+    """Rebuild vs.index as `kind` from its stored vectors; row order (and so the id map) is kept."""
+    vs.index = build_index(all_vectors(vs.index), kind, quantization)
+
+def _delete_chunks(vs: FAISS, ids: List[str]) -> None:
+    if supports_remove(vs.index):
+        vs.delete(ids)
+        return
+    # HNSW and IVF can't remove in place: rebuild from the surviving vectors
+    drop = set(ids)
+    keep = [(pos, i) for pos, i in sorted(vs.index_to_docstore_id.items()) if i not in drop]
+    vectors = all_vectors(vs.index)[[pos for pos, _ in keep]]
+    vs.index = build_index(vectors, index_type(vs.index), index_quantization(vs.index))
+    vs.index_to_docstore_id = {n: i for n, (_, i) in enumerate(keep)}
+    vs.docstore.delete(ids)
+
+def save_vectorstore(vs: FAISS, path: str, embedding: Optional[Dict] = None) -> None:
+    """Write vs as a snapshot into `path`, a fresh version directory."""
+    index = vs.index
+    ids = [vs.index_to_docstore_id[pos] for pos in range(index.ntotal)]
+    kind, quantization = index_type(index), index_quantization(index)
+    write_index = None
+    if kind != "flat" or quantization != "none":
+        inner = index.index if isinstance(index, RerankIndex) else index
+        write_index = lambda file: faiss.write_index(inner, file)
+    # a quantized index keeps its re-rank vectors at their reduced precision
+    vectors = index.vectors if isinstance(index, RerankIndex) else all_vectors(index)
+    write_snapshot(path, vectors, ids, [vs.docstore.search(i) for i in ids],
+                   {"type": kind, "quantization": quantization}, write_index,
+                   embedding=embedding or embedding_spec(index.d))
+
+def index_fingerprint(path: Optional[str] = None, root: str = VECTORSTORE_DIR) -> tuple:
+    """Published directory plus (name, mtime_ns, size) of its files; changes on every publish."""
+    path = path or current_index_dir(root)
+    parts = [path]
+    for name in (SNAPSHOT_FILE, "index.faiss", "index.pkl"):
+        try:
+            s = os.stat(os.path.join(path, name))
+            parts.append((name, s.st_mtime_ns, s.st_size))
+        except FileNotFoundError:
+            parts.append((name, 0, 0))
+    return tuple(parts)
+
+# ---------------- Versions ----------------
+def current_index_dir(root: str = VECTORSTORE_DIR) -> str:
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            return os.path.join(root, "versions", f.read().strip())
+    except FileNotFoundError:
+        return root
+
+def index_exists(path: Optional[str] = None, root: str = VECTORSTORE_DIR) -> bool:
+    path = path or current_index_dir(root)
+    return any(os.path.exists(os.path.join(path, name)) for name in (SNAPSHOT_FILE, "index.faiss"))
+
+def new_version_dir(root: str = VECTORSTORE_DIR) -> str:
+    path = os.path.join(root, "versions", datetime.now().strftime("%Y%m%d-%H%M%S-%f"))
+    os.makedirs(path)
+    return path
+
+def publish_version(path: str, root: str = VECTORSTORE_DIR) -> None:
+    """Point <root>/CURRENT at a fully written version directory (atomic rename), then prune."""
+    current_file = os.path.join(root, "CURRENT")
+    tmp = f"{current_file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, current_file)
+    _prune_versions(root)
+
+def _prune_versions(root: str, keep: int = KEEP_VERSIONS) -> None:
+    # Older versions stay on disk for a while so sessions still reading them (mmap,
+    # open file handles) finish undisturbed; on POSIX, removal is safe even then.
+    versions = os.path.join(root, "versions")
+    current = os.path.basename(current_index_dir(root))
+    for name in sorted(os.listdir(versions))[:-keep]:
+        if name != current:
+            shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+    # The pre-versioning files in the root (index.faiss, index.pkl, metadata.json) are
+    # the index shipped in git. Once CURRENT exists nothing reads them, so they stay put
+    # rather than leave every deployment with a dirty working tree.
+
+# ---------------- Build lock ----------------
+class BuildLockTimeout(TimeoutError):
+    pass
+
+@contextmanager
+def build_lock(root: str = VECTORSTORE_DIR, timeout: float = BUILD_LOCK_TIMEOUT, poll: float = 0.5):
+    """Exclusive inter-process lock around a build of `root`; waits up to `timeout` seconds."""
+    os.makedirs(root, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    with open(os.path.join(root, ".build.lock"), "a+", encoding="utf-8") as f:
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise BuildLockTimeout(f"Another process has been building the index for over {timeout:.0f}s")
+                time.sleep(poll)
+        try:
+            f.truncate(0)
+            f.write(f"{os.getpid()}\n")  # holder, for whoever is debugging a stuck build
+            f.flush()
+            yield
+        finally:
+            _unlock(f)
+
+# ---------------- Manifest ----------------
+# metadata.json doubles as the build manifest:
+#   {"built_at", "pdf_files", "next_chunk_id",
+#    "files": {name: {"sha256", "size", "mtime", "pages", "chunk_ids": [start, end)}}}
+# Chunk ids are docstore ids str(n); each PDF owns one contiguous range, so a changed
+# or deleted PDF's vectors can be dropped without touching the rest of the index.
+
+def read_manifest(path: Optional[str] = None, root: str = VECTORSTORE_DIR) -> Dict:
+    path = path or os.path.join(current_index_dir(root), METADATA_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_manifest(manifest: Dict, path: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+def _file_entry(pdf: str, sha: str) -> Dict:
+    s = os.stat(pdf)
+    return {"sha256": sha, "size": s.st_size, "mtime": s.st_mtime}
+
+def plan_update(pdfs: List[str], manifest: Dict, retry_quarantined: bool = False) -> Dict[str, List[str]]:
+    """Split the folder's PDFs into unchanged / changed / new, plus manifest entries now deleted."""
+    known = manifest.get("files", {})
+    plan = {"unchanged": [], "changed": [], "new": [], "deleted": [], "touched": [], "refold": [], "retry": [],
+            "sha256": {}}
+    for pdf in pdfs:
+        name = doc_name(pdf)
+        entry = known.get(name)
+        # cheap stat match first; only hash files whose size/mtime moved
+        same_stat = entry and entry.get("size") == os.path.getsize(pdf) and entry.get("mtime") == os.path.getmtime(pdf)
+        sha = entry["sha256"] if same_stat else file_sha256(pdf)
+        plan["sha256"][name] = sha
+        if entry is None:
+            plan["new"].append(pdf)
+        elif entry.get("sha256") != sha:
+            plan["changed"].append(pdf)
+        else:
+            plan["unchanged"].append(pdf)
+            if not same_stat:
+                plan["touched"].append(pdf)  # new mtime, same bytes: refresh stats only
+    names = {doc_name(p) for p in pdfs}
+    plan["deleted"] = [n for n in known if n not in names]
+    if retry_quarantined:
+        # unchanged files that lost pages (or failed outright) last time get another go
+        plan["retry"] = [p for p in plan["unchanged"]
+                         if known[doc_name(p)].get("quarantined") or known[doc_name(p)].get("error")]
+        for pdf in plan["retry"]:
+            plan["unchanged"].remove(pdf)
+            plan["changed"].append(pdf)
+    # an unchanged file whose duplicate chunks were folded into chunks of a file that is
+    # going away has lost them from the index: re-chunk it too (and whatever folded into it)
+    plan["refold"] = []
+    removed = set(plan["deleted"]) | {doc_name(p) for p in plan["changed"]}
+    while True:
+        refold = [p for p in plan["unchanged"] if removed & set(known[doc_name(p)].get("folded_into", []))]
+        if not refold:
+            return plan
+        for pdf in refold:
+            plan["unchanged"].remove(pdf)
+            plan["changed"].append(pdf)
+            plan["refold"].append(pdf)
+            removed.add(doc_name(pdf))
+
+def index_staleness(pdfs: Optional[List[str]] = None, manifest: Optional[Dict] = None,
+                    root: str = VECTORSTORE_DIR) -> Dict:
+    """Stat-only comparison of the PDF folder with the published manifest (no hashing, no PDF reads).
+
+    "modified" means size or mtime moved; update_vectorstore() then hashes those files
+    and re-embeds only the ones whose content really changed.
+    """
+    pdfs = list_pdfs() if pdfs is None else pdfs
+    manifest = read_manifest(root=root) if manifest is None else manifest
+    stats = {doc_name(p): os.stat(p) for p in pdfs}
+    known = manifest.get("files")
+    if known is None:
+        # manifest from before per-file stats: only names can be compared
+        known = {n: None for n in manifest.get("pdf_files", [])}
+    modified = [n for n, s in stats.items() if known.get(n) is not None
+                and (known[n].get("size"), known[n].get("mtime")) != (s.st_size, s.st_mtime)]
+    result = {
+        "new": sorted(set(stats) - set(known)),
+        "modified": sorted(modified),
+        "deleted": sorted(set(known) - set(stats)),
+        "signature": tuple(sorted((n, s.st_size, s.st_mtime_ns) for n, s in stats.items())),
+    }
+    # a published index of another embedding model/size has to be re-embedded as a whole
+    result["embedding_changed"] = bool(manifest) and manifest_embedding(manifest) != embedding_spec()
+    result["chunking_changed"] = bool(manifest) and manifest.get("chunking", LEGACY_CHUNKING) != chunking_spec()
+    result["stale"] = bool(result["new"] or result["modified"] or result["deleted"]
+                           or result["embedding_changed"] or result["chunking_changed"])
+    return result
+
+def update_vectorstore(api_key: str, pdfs: Optional[List[str]] = None, warn: Optional[Warn] = None,
+                       progress: Optional[BuildProgress] = None, root: str = VECTORSTORE_DIR,
+                       retry_quarantined: bool = False) -> Tuple[Optional[FAISS], Dict]:
+    """Bring the index in line with the PDF folder, embedding only new/changed files.
+
+    The result is written to a new version directory and published atomically.
+    Falls back to a full build when there is no index or the manifest predates
+    per-file chunk ids. Returns (vectorstore or None, report).
+
+    Runs under build_lock(): a caller that has to wait re-plans against whatever
+    the previous holder published, so work already done is reused, not repeated.
+    """
+    tokenizer()  # chunks need their token counts: fail now, not after extracting everything
+    progress = progress or BuildProgress()
+    progress.set_stage("waiting")
+    with build_lock(root):
+        cache = open_page_cache() if KB_PAGE_CACHE else None
+        try:
+            return _update_vectorstore(api_key, pdfs, warn or log.warning, progress, root, cache,
+                                       retry_quarantined)
+        finally:
+            if cache is not None:
+                cache.close()
+
+def open_page_cache() -> PageCache:
+    os.makedirs(os.path.dirname(PAGE_CACHE_FILE), exist_ok=True)
+    return PageCache(PAGE_CACHE_FILE, EXTRACTOR_VERSION)
+
+def _update_vectorstore(api_key: str, pdfs: Optional[List[str]], warn: Warn, progress: BuildProgress,
+                        root: str, cache: Optional[PageCache] = None,
+                        retry_quarantined: bool = False) -> Tuple[Optional[FAISS], Dict]:
+    pdfs = list_pdfs() if pdfs is None else pdfs
+    embeddings = get_embeddings(api_key)
+
+    base_dir = current_index_dir(root)
+    manifest = read_manifest(os.path.join(base_dir, METADATA_FILE))
+    incremental = index_exists(base_dir) and "files" in manifest
+    if incremental and manifest_embedding(manifest) != embedding_spec():
+        log.info("Embedding settings changed (%s -> %s); re-embedding everything",
+                 manifest_embedding(manifest), embedding_spec())
+        incremental = False
+    if incremental and manifest.get("chunking", LEGACY_CHUNKING) != chunking_spec():
+        log.info("Chunking changed (%s -> %s); re-chunking everything",
+                 manifest.get("chunking", LEGACY_CHUNKING), chunking_spec())
+        incremental = False
+    if not incremental:
+        manifest = {"files": {}, "next_chunk_id": 0}
+    plan = plan_update(pdfs, manifest, retry_quarantined)
+    files = manifest["files"]
+    next_id = manifest.get("next_chunk_id", 0)
+
+    for pdf in plan["touched"]:
+        files[doc_name(pdf)].update(_file_entry(pdf, plan["sha256"][doc_name(pdf)]))
+
+    removed = set(plan["deleted"]) | {doc_name(p) for p in plan["changed"]}
+    stale_ids = []
+    for name in removed:
+        start, end = files.pop(name)["chunk_ids"]
+        stale_ids.extend(str(i) for i in range(start, end))
+
+    vs = _load_faiss(base_dir, embeddings, writable=True) if incremental else None
+    if vs is not None and stale_ids:
+        _delete_chunks(vs, stale_ids)
+        _drop_sources(vs.docstore._dict.values(), removed)
+
+    # Streaming: each PDF is chunked as soon as its pages come back, and chunks are
+    # embedded EMBED_BATCH at a time into a flat staging index, so pages, chunks and
+    # vectors never pile up for the whole batch. Staging is merged into vs at the end.
+    folder = DuplicateFolder(vs.docstore._dict if vs is not None else {}) if KB_DEDUP else None
+    staged, pending, pending_ids = None, [], []
+    stripped_total = tokens_total = 0
+    to_parse = plan["changed"] + plan["new"]
+    hashes = {pdf: plan["sha256"][doc_name(pdf)] for pdf in to_parse}
+    # progress is shared by every shard of a build: file and chunk counts are per shard
+    progress.set_stage("ingesting", files_total=len(to_parse), files_done=0, chunks_total=0, chunks_embedded=0)
+    quarantined, image_only_pages = {}, {}
+    extracted = extract_pdfs(to_parse, cache=cache, hashes=hashes,
+                             budget_factor=RETRY_BUDGET_FACTOR if retry_quarantined else 1.0)
+    for pdf, pages, n_pages, error, skipped, image_only in extracted:
+        name = doc_name(pdf)
+        if error:
+            warn(f"Could not read {pdf}: {error}")
+            progress.add(files_done=1)
+            # remembered with its hash so it isn't retried until the file changes
+            files[name] = dict(_file_entry(pdf, plan["sha256"][name]), pages=0,
+                               chunk_ids=[next_id, next_id], error=error)
+            continue
+        docs, stripped = strip_boilerplate(page_docs(pdf, pages))
+        chunks = split_docs(docs)
+        holders = []
+        if folder is not None:
+            chunks, holders = folder.fold(name, chunks)
+        entry = _file_entry(pdf, plan["sha256"][name])
+        entry.update(pages=n_pages, chunk_ids=[next_id, next_id + len(chunks)], boilerplate_chars=stripped)
+        if holders:
+            entry["folded_into"] = holders
+        if skipped:
+            # left out of the index until the file changes or a retry build succeeds
+            entry["quarantined"] = quarantined[name] = [
+                {"pages": [first, last], "reason": reason} for first, last, reason in skipped]
+            warn(f"Skipped pages of {name}: " + "; ".join(
+                f"{first}-{last} ({reason})" if first != last else f"{first} ({reason})"
+                for first, last, reason in skipped))
+        if image_only:
+            # scanned sheets/drawings: no text layer, so a coverage gap until OCR'd
+            entry["image_only_pages"] = image_only_pages[name] = page_spans(image_only)
+        files[name] = entry
+        pending.extend(chunks)
+        pending_ids.extend(str(i) for i in range(next_id, next_id + len(chunks)))
+        next_id += len(chunks)
+        stripped_total += stripped
+        tokens_total += sum(c.metadata.get("tokens", 0) for c in chunks)
+        progress.add(files_done=1, pages_parsed=n_pages, chunks_total=len(chunks))
+        while len(pending) >= EMBED_BATCH:
+            staged = _embed_into(staged, pending[:EMBED_BATCH], pending_ids[:EMBED_BATCH], embeddings, progress)
+            del pending[:EMBED_BATCH], pending_ids[:EMBED_BATCH]
+    if pending:
+        staged = _embed_into(staged, pending, pending_ids, embeddings, progress)
+
+    # pick the index type for the corpus size after this update; a corpus that crosses
+    # a threshold (or a changed FAISS_QUANTIZATION) is re-indexed from its stored
+    # vectors, not re-embedded
+    n_total = (vs.index.ntotal if vs is not None else 0) + (staged.index.ntotal if staged is not None else 0)
+    kind, quantization = choose_index_type(n_total), effective_quantization(n_total)
+    if vs is None:
+        vs, staged = staged, None
+    if vs is not None and (index_type(vs.index), index_quantization(vs.index)) != (kind, quantization):
+        _reindex(vs, kind, quantization)
+    if staged is not None:
+        ids = [staged.index_to_docstore_id[pos] for pos in range(staged.index.ntotal)]
+        _append(vs, [staged.docstore.search(i) for i in ids], ids, all_vectors(staged.index))
+
+    report = {k: [doc_name(p) for p in plan[k]] for k in ("new", "changed", "unchanged")}
+    report["deleted"] = plan["deleted"]
+    report["removed_chunks"] = len(stale_ids)
+    report["duplicate_chunks"] = folder.dropped if folder is not None else 0
+    report["boilerplate_chars"] = stripped_total
+    report["chunk_tokens"] = tokens_total
+    report["refolded"] = [doc_name(p) for p in plan["refold"]]
+    report["retried"] = [doc_name(p) for p in plan["retry"]]
+    report["quarantined"] = quarantined
+    report["image_only_pages"] = image_only_pages
+    if cache is not None:
+        report["page_cache"] = cache.stats()
+        log.info("Page cache: %s", report["page_cache"])
+
+    if vs is None:
+        return None, report
+    spec = {"type": index_type(vs.index), "quantization": index_quantization(vs.index)}
+    # the shipped pre-versioning files are tracked: a touched manifest there is
+    # published as a new version instead of rewritten in place
+    in_place = not plan["touched"] or base_dir != root
+    if not (report["new"] or report["changed"] or stale_ids) and incremental and in_place and \
+            {k: manifest.get("index", {}).get(k) for k in spec} == spec:
+        if plan["touched"]:
+            write_manifest(manifest, os.path.join(base_dir, METADATA_FILE))
+        return vs, report
+
+    progress.set_stage("saving")
+    out_dir = new_version_dir(root)
+    save_vectorstore(vs, out_dir, embedding_spec())
+    manifest.update(
+        embedding=embedding_spec(),
+        chunking=chunking_spec(),
+        built_at=datetime.now().isoformat(timespec="seconds"),
+        pdf_files=sorted(files),
+        next_chunk_id=next_id,
+        index=dict(spec, vectors=int(vs.index.ntotal)),
+        files=dict(sorted(files.items())),
+    )
+    write_manifest(manifest, os.path.join(out_dir, METADATA_FILE))
+    publish_version(out_dir, root)
+    return vs, report
+
+# ---------------- Shards ----------------
+def shard_of(pdf: str) -> str:
+    name = doc_name(pdf).lower()
+    hits = [shard for shard, rule in SHARD_RULES.items() if re.search(rule, name)]
+    return hits[0] if len(hits) == 1 else GENERAL_SHARD
+
+def index_roots() -> Dict[str, str]:
+    """Index root per shard; a single "all" root when sharding is off."""
+    if not KB_SHARDED:
+        return {"all": VECTORSTORE_DIR}
+    return {name: os.path.join(SHARDS_DIR, name) for name in SHARD_NAMES}
+
+def pdfs_by_shard(pdfs: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    pdfs = list_pdfs() if pdfs is None else pdfs
+    if not KB_SHARDED:
+        return {"all": list(pdfs)}
+    out = {name: [] for name in SHARD_NAMES}
+    for pdf in pdfs:
+        out[shard_of(pdf)].append(pdf)
+    return out
+
+def kb_exists() -> bool:
+    return any(index_exists(root=root) for root in index_roots().values())
+
+def kb_fingerprint() -> tuple:
+    return tuple(index_fingerprint(root=root) for root in index_roots().values())
+
+def kb_manifest() -> Dict:
+    if not KB_SHARDED:
+        return read_manifest()
+    return {name: m for name, root in index_roots().items() if (m := read_manifest(root=root))}
+
+def kb_quarantined() -> Dict[str, List[Dict]]:
+    """{file: quarantined page spans, or the read error} across every published index."""
+    out = {}
+    for root in index_roots().values():
+        for name, entry in read_manifest(root=root).get("files", {}).items():
+            if entry.get("quarantined"):
+                out[name] = entry["quarantined"]
+            elif entry.get("error"):
+                out[name] = [{"pages": None, "reason": f"unreadable: {entry['error']}"}]
+    return out
+
+def kb_image_only() -> Dict[str, List[List[int]]]:
+    """{file: spans of image-only pages} across every published index."""
+    return {name: entry["image_only_pages"] for root in index_roots().values()
+            for name, entry in read_manifest(root=root).get("files", {}).items() if entry.get("image_only_pages")}
+
+def kb_staleness(pdfs: Optional[List[str]] = None) -> Dict:
+    """index_staleness() over every shard, merged into one folder-level result."""
+    pdfs = list_pdfs() if pdfs is None else pdfs
+    roots, parts = index_roots(), pdfs_by_shard(pdfs)
+    merged = {"new": [], "modified": [], "deleted": [], "shards": [], "embedding_changed": False,
+              "chunking_changed": False}
+    for name, root in roots.items():
+        part = index_staleness(parts[name], root=root)
+        for k in ("new", "modified", "deleted"):
+            merged[k].extend(part[k])
+        merged["embedding_changed"] |= part["embedding_changed"]
+        merged["chunking_changed"] |= part["chunking_changed"]
+        if part["stale"]:
+            merged["shards"].append(name)
+    merged["stale"] = bool(merged["shards"])
+    merged["signature"] = tuple(sorted((doc_name(p), os.path.getsize(p), os.stat(p).st_mtime_ns) for p in pdfs))
+    return merged
+
+def update_knowledge_base(api_key: str, pdfs: Optional[List[str]] = None, warn: Optional[Warn] = None,
+                          progress: Optional[BuildProgress] = None, shards: Optional[List[str]] = None,
+                          retry_quarantined: bool = False) -> Dict:
+    """update_vectorstore() for each shard (or only `shards`); returns {shard: report}."""
+    roots, parts = index_roots(), pdfs_by_shard(pdfs)
+    reports = {}
+    for name in shards or roots:
+        # a shard with no PDFs and no index has nothing to do
+        if parts[name] or index_exists(root=roots[name]):
+            _, reports[name] = update_vectorstore(api_key, parts[name], warn, progress, root=roots[name],
+                                                  retry_quarantined=retry_quarantined)
+    return reports
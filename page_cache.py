@@ -0,0 +1,67 @@
+# page_cache.py — extracted page text kept across builds, keyed by
+# (file sha256, page number, extractor version), so re-chunking or re-embedding
+# an unchanged PDF never parses it again
+
+import json, sqlite3, threading
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (sha256 TEXT, version TEXT, n_pages INTEGER NOT NULL,
+                                  image_only TEXT NOT NULL DEFAULT '[]', PRIMARY KEY (sha256, version));
+CREATE TABLE IF NOT EXISTS pages (sha256 TEXT, version TEXT, page INTEGER, text TEXT NOT NULL,
+                                  PRIMARY KEY (sha256, version, page));
+"""
+
+
+class PageCache:
+    """A file is cached whole or not at all: `files` marks a complete extraction, and
+    `pages` holds its pages that had text. Entries of other extractor versions are
+    dropped on open."""
+
+    def __init__(self, path: str, version: str):
+        self.version = version
+        self.hits = self.misses = 0   # pages served from / written to the cache
+        self._lock = threading.Lock()
+        # builds of different shards may share the file from several processes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+            if "image_only" not in columns:  # cache file from before image-only pages were recorded
+                self._conn.execute("ALTER TABLE files ADD COLUMN image_only TEXT NOT NULL DEFAULT '[]'")
+            self._conn.execute("DELETE FROM files WHERE version != ?", (version,))
+            self._conn.execute("DELETE FROM pages WHERE version != ?", (version,))
+
+    def contains(self, sha256: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM files WHERE sha256 = ? AND version = ?",
+                                      (sha256, self.version)).fetchone() is not None
+
+    def get(self, sha256: str) -> Optional[Tuple[int, List[Tuple[int, str]], List[int]]]:
+        """(page count, [(page, text), ...], image-only pages) if the whole file is cached."""
+        with self._lock:
+            row = self._conn.execute("SELECT n_pages, image_only FROM files WHERE sha256 = ? AND version = ?",
+                                     (sha256, self.version)).fetchone()
+            if row is None:
+                return None
+            pages = self._conn.execute("SELECT page, text FROM pages WHERE sha256 = ? AND version = ? ORDER BY page",
+                                       (sha256, self.version)).fetchall()
+            self.hits += row[0]
+        return row[0], pages, json.loads(row[1])
+
+    def put(self, sha256: str, n_pages: int, pages: List[Tuple[int, str]], image_only: List[int] = ()) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                                   ((sha256, self.version, n, text) for n, text in pages))
+            self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                               (sha256, self.version, n_pages, json.dumps(list(image_only))))
+            self.misses += n_pages
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hit_pages": self.hits, "miss_pages": self.misses,
+                    "hit_rate": round(self.hits / total, 3) if total else None}
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,362 @@
+# pdf_extract.py — PDF page text extraction fanned out over a process pool
+#
+# pypdf is pure Python and CPU-bound, so threads don't help. Each PDF is cut into
+# PAGES_PER_TASK page ranges that worker processes extract independently; results
+# are reassembled per file in input order, and a file that fails is reported as
+# failed without stopping the rest of the batch.
+#
+# Time budgets: a page that takes longer than PAGE_BUDGET_S is abandoned inside its
+# worker (SIGALRM) and quarantined; a range whose worker stops answering altogether
+# gets the pool killed and restarted, and so does one whose worker dies outright
+# (segfault, OOM kill); a file that has used FILE_BUDGET_S of
+# extraction time has the rest of its pages quarantined. Quarantined pages are
+# returned with their reason so builds can report them and retry later.
+#
+# Pages whose content stream paints no text (classify_page) skip extract_text()
+# entirely: scanned sheets and drawings are reported as image-only, empty pages dropped.
+
+import os, re, time, signal, threading, multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import pypdf
+from pypdf import PdfReader
+
+from page_cache import PageCache
+
+# Part of the page cache key: bump the suffix whenever extract_range() output changes.
+EXTRACTOR_VERSION = f"pypdf-{pypdf.__version__}+4"
+EXTRACT_WORKERS  = int(os.getenv("KB_EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+PAGES_PER_TASK   = int(os.getenv("KB_EXTRACT_PAGES_PER_TASK", "16"))
+IN_FLIGHT_PER_WORKER = 2
+PAGE_BUDGET_S    = float(os.getenv("KB_PAGE_BUDGET_S", "20"))
+FILE_BUDGET_S    = float(os.getenv("KB_FILE_BUDGET_S", "300"))
+HANG_GRACE_S     = 30   # on top of a range's page budgets before its worker counts as hung
+
+Skipped = Tuple[int, int, str]   # (first page, last page, reason), 1-based and inclusive
+
+
+class Extracted(NamedTuple):
+    pdf: str
+    pages: List[Tuple[int, str]]   # (1-based page number, text) for pages with text
+    n_pages: int
+    error: Optional[str]
+    skipped: List[Skipped] = []
+    image_only: List[int] = []     # pages that paint images but no text: nothing to extract without OCR
+
+
+class RangeResult(NamedTuple):
+    pages: List[Tuple[int, str]]
+    skipped: List[Skipped]
+    image_only: List[int]
+    seconds: float
+
+
+def page_count(pdf: str) -> int:
+    return len(PdfReader(pdf).pages)
+
+
+class PageTimeout(BaseException):
+    # not an Exception: pypdf swallows Exception in many places (form XObjects, cmaps),
+    # and the alarm fires only once, so a swallowed timeout would leave the page unbounded
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise PageTimeout()
+
+
+# Content-stream operators, as whole tokens: Tj/TJ/'/" show text (a bare BT ... ET
+# shows nothing, and some producers emit one on every page), BI starts an inline image,
+# "/Name Do" paints an XObject. A false hit only means a page gets extracted.
+_TEXT_OP  = re.compile(rb"(?<=[\s\]\)>])(?:Tj|TJ|'|\")(?![^\s\[(</])")
+_INLINE   = re.compile(rb"(?<![^\s])BI(?![^\s/])")
+_DO       = re.compile(rb"/([^\s/\[\]()<>{}%]+)\s*Do(?![^\s\[(</])")
+FORM_DEPTH = 3   # nested form XObjects followed before a page is just extracted
+
+
+def _stream_data(contents) -> bytes:
+    contents = contents.get_object() if contents is not None else None
+    if contents is None:
+        return b""
+    if isinstance(contents, list):  # an array of streams is one content stream
+        return b"\n".join(part.get_object().get_data() for part in contents)
+    return contents.get_data()
+
+
+def _content_kinds(data: bytes, resources, depth: int = 0) -> Set[str]:
+    """{"text", "image"} that a content stream paints, following the XObjects it uses."""
+    kinds = set()
+    if _TEXT_OP.search(data):
+        kinds.add("text")
+    if _INLINE.search(data):
+        kinds.add("image")
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    for name in {m.group(1) for m in _DO.finditer(data)}:
+        xobject = xobjects.get("/" + name.decode("latin-1"))
+        xobject = xobject.get_object() if xobject is not None else None
+        if xobject is None:
+            continue
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            kinds.add("image")
+        elif subtype == "/Form":
+            if depth >= FORM_DEPTH:
+                kinds.add("text")  # deep nesting: leave it to extraction
+            else:
+                kinds |= _content_kinds(xobject.get_data(), xobject.get("/Resources", resources), depth + 1)
+    return kinds
+
+
+def classify_page(page) -> str:
+    """"text", "image" or "blank" from a cheap scan of the page's content stream.
+
+    Resources alone can't tell: producers that share one resource dict across pages
+    give an image-only page fonts, and inline images (BI ... EI) list no XObject.
+    A page needs a font and a text-showing operator (on the page or in a form it
+    draws) to be worth extract_text(); otherwise it is image-only if it paints an
+    image at all.
+    """
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    kinds = _content_kinds(_stream_data(page.get("/Contents")), resources)
+    if "text" in kinds and _has_fonts(resources):
+        return "text"
+    return "image" if "image" in kinds else "blank"
+
+
+def _has_fonts(resources) -> bool:
+    if resources.get("/Font"):
+        return True
+    # a form XObject brings its own resources, fonts included
+    xobjects = resources.get("/XObject")
+    return bool(xobjects) and any(x.get_object().get("/Subtype") == "/Form" for x in xobjects.get_object().values())
+
+
+def extract_range(pdf: str, start: int, stop: int, page_budget: float = 0) -> RangeResult:
+    """Text of pages [start, stop) (0-based) that have any, plus the pages given up on or
+    found image-only, and the seconds spent. page_budget only applies on the main
+    thread of a process with SIGALRM, i.e. in pool workers on POSIX."""
+    t0 = time.perf_counter()
+    alarm = bool(page_budget) and hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    previous = signal.signal(signal.SIGALRM, _on_alarm) if alarm else None
+    reader = PdfReader(pdf)
+    pages, skipped, image_only = [], [], []
+    try:
+        for i in range(start, min(stop, len(reader.pages))):
+            try:
+                if alarm:
+                    signal.setitimer(signal.ITIMER_REAL, page_budget)
+                page = reader.pages[i]
+                kind = classify_page(page)
+                if kind == "image":
+                    image_only.append(i + 1)
+                text = (page.extract_text() or "") if kind == "text" else ""
+            except PageTimeout:
+                skipped.append((i + 1, i + 1, f"page took over {page_budget:g}s"))
+                continue
+            except Exception as e:
+                skipped.append((i + 1, i + 1, f"error: {e}"))
+                continue
+            finally:
+                if alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+            if text.strip():
+                pages.append((i + 1, text))
+    finally:
+        if alarm:
+            signal.signal(signal.SIGALRM, previous)
+    return RangeResult(pages, skipped, image_only, time.perf_counter() - t0)
+
+
+def _given_up(task, reason: str) -> RangeResult:
+    _, start, stop, _ = task
+    return RangeResult([], [(start + 1, stop, reason)], [], 0.0)
+
+
+def _ranges(n_pages: int, size: int) -> List[Tuple[int, int]]:
+    return [(s, min(s + size, n_pages)) for s in range(0, n_pages, size)]
+
+
+class _Pool:
+    """Process pool whose workers can be killed when one hangs past every budget."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.inflight = deque()   # (task, future), in submission order
+        self._start()
+
+    def _start(self) -> None:
+        # spawn, not fork: the builder runs on a thread of a multi-threaded server process
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, task) -> None:
+        self.inflight.append((task, self._future(task)))
+
+    def _future(self, task) -> Future:
+        try:
+            return self.pool.submit(extract_range, *task)
+        except BrokenProcessPool as e:  # a worker died since the last result; next_result sorts it out
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def next_result(self):
+        task, future = self.inflight.popleft()
+        try:
+            return future.result(timeout=self._timeout(task))
+        except FuturesTimeout:
+            self.restart()
+            return _given_up(task, "extraction worker stopped responding")
+        except BrokenProcessPool:
+            # A dead worker fails every pending range, not just its own: rerun this one
+            # alone to tell whether it was the cause, then resubmit the rest.
+            self._kill()
+            got = self._run_alone(task)
+            self._resubmit()
+            return got
+
+    def _timeout(self, task) -> Optional[float]:
+        _, start, stop, page_budget = task
+        return (stop - start) * page_budget + HANG_GRACE_S if page_budget else None
+
+    def _run_alone(self, task) -> RangeResult:
+        try:
+            return self.pool.submit(extract_range, *task).result(timeout=self._timeout(task))
+        except FuturesTimeout:
+            self._kill()
+            return _given_up(task, "extraction worker stopped responding")
+        except BrokenProcessPool:
+            self._kill()
+            return _given_up(task, "extraction worker crashed")
+
+    def restart(self) -> None:
+        self._kill()
+        self._resubmit()
+
+    def _kill(self) -> None:
+        # ProcessPoolExecutor can't cancel a running task, so kill its processes
+        procs = list((getattr(self.pool, "_processes", None) or {}).values())
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        for p in procs:
+            p.terminate()
+        self._start()
+
+    def _resubmit(self) -> None:
+        # keep finished results and over-budget placeholders (None); resubmit the rest
+        keep = lambda f: f is None or (f.done() and not f.cancelled() and f.exception() is None)
+        self.inflight = deque((t, f) if keep(f) else (t, self._future(t)) for t, f in self.inflight)
+
+    def close(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+
+
+def extract_pdfs(pdfs: Iterable[str], workers: int = EXTRACT_WORKERS, pages_per_task: int = PAGES_PER_TASK,
+                 cache: Optional[PageCache] = None, hashes: Optional[Dict[str, str]] = None,
+                 budget_factor: float = 1.0) -> Iterator[Extracted]:
+    """Yield one Extracted per PDF, in the order given.
+
+    With a cache (and each PDF's sha256 in `hashes`), files already extracted by this
+    EXTRACTOR_VERSION are served from it without being opened; complete extractions
+    with nothing quarantined are stored. budget_factor scales both time budgets (for
+    retries). At most IN_FLIGHT_PER_WORKER ranges per worker are queued ahead of the
+    file being yielded, so memory stays bounded however many pages the batch holds.
+    """
+    pdfs = list(pdfs)
+    hashes = hashes if cache is not None else None
+    page_budget, file_budget = PAGE_BUDGET_S * budget_factor, FILE_BUDGET_S * budget_factor
+    counts, cached = {}, set()
+    for pdf in pdfs:
+        if hashes and cache.contains(hashes[pdf]):
+            cached.add(pdf)  # read back when its turn comes, not all up front
+            continue
+        try:
+            counts[pdf] = page_count(pdf)
+        except Exception as e:
+            counts[pdf] = e
+    tasks = [(pdf, s, e, page_budget) for pdf in pdfs if isinstance(counts.get(pdf), int)
+             for s, e in _ranges(counts[pdf], pages_per_task)]
+    if not tasks:  # all cached, unreadable or empty
+        for pdf in pdfs:
+            if pdf in cached:
+                yield _from_cache(pdf, cache, hashes)
+            elif isinstance(counts[pdf], Exception):
+                yield Extracted(pdf, [], 0, str(counts[pdf]))
+            else:
+                yield Extracted(pdf, [], counts[pdf], None)
+        return
+    # always in worker processes, even for one PDF: that is what makes the budgets enforceable
+    pool = _Pool(max(1, min(workers, len(tasks))))
+    queue = iter(tasks)
+    over_budget: Set[str] = set()
+    try:
+        for pdf in pdfs:
+            if pdf in cached:
+                yield _from_cache(pdf, cache, hashes)
+                continue
+            n_pages = counts[pdf]
+            if isinstance(n_pages, Exception):
+                yield Extracted(pdf, [], 0, str(n_pages))
+                continue
+            pages, skipped, image_only, spent = [], [], [], 0.0
+            for _ in _ranges(n_pages, pages_per_task):
+                while len(pool.inflight) < pool.workers * IN_FLIGHT_PER_WORKER:
+                    task = next(queue, None)
+                    if task is None:
+                        break
+                    if task[0] in over_budget:
+                        pool.inflight.append((task, None))
+                    else:
+                        pool.submit(task)
+                task, future = pool.inflight[0]
+                _, start, stop, _ = task
+                if future is None or pdf in over_budget:
+                    pool.inflight.popleft()
+                    if future is not None:
+                        future.cancel()
+                    skipped.append((start + 1, stop, f"file used its {file_budget:g}s extraction budget"))
+                    continue
+                try:
+                    got = pool.next_result()
+                except Exception as e:
+                    got = RangeResult([], [(start + 1, stop, f"error: {e}")], [], 0.0)
+                pages.extend(got.pages)
+                skipped.extend(got.skipped)
+                image_only.extend(got.image_only)
+                spent += got.seconds
+                if file_budget and spent > file_budget:
+                    over_budget.add(pdf)
+            if hashes and not skipped:
+                cache.put(hashes[pdf], n_pages, pages, image_only)
+            yield Extracted(pdf, pages, n_pages, None, _merge(skipped), image_only)
+    finally:
+        pool.close()
+
+
+def _from_cache(pdf: str, cache: PageCache, hashes: Dict[str, str]) -> Extracted:
+    hit = cache.get(hashes[pdf])
+    if hit is not None:
+        n_pages, pages, image_only = hit
+        return Extracted(pdf, pages, n_pages, None, [], image_only)
+    # purged meanwhile by a build of another extractor version
+    try:
+        n_pages = page_count(pdf)
+        got = extract_range(pdf, 0, n_pages)
+        return Extracted(pdf, got.pages, n_pages, None, got.skipped, got.image_only)
+    except Exception as e:
+        return Extracted(pdf, [], 0, str(e))
+
+
+def _merge(skipped: List[Skipped]) -> List[Skipped]:
+    """Join adjacent spans with the same reason."""
+    out = []
+    for first, last, reason in sorted(skipped):
+        if out and out[-1][2] == reason and out[-1][1] + 1 >= first:
+            out[-1] = (out[-1][0], max(out[-1][1], last), reason)
+        else:
+            out.append((first, last, reason))
+    return out
@@ -0,0 +1,27 @@
+"""Run the chat app with warm-up and the readiness probe started before any session connects.
+
+    python serve.py [streamlit options, e.g. --server.port 8501]
+
+`streamlit run app_tabs.py` still works; the app then starts warm-up on its first
+session instead, so the first visitor may see a cold start.
+"""
+
+import os, sys
+
+from dotenv import load_dotenv
+from streamlit.web import cli as stcli
+
+load_dotenv()  # before serving: it and knowledge_base read their settings on import
+
+import serving
+
+
+def main():
+    serving.start(os.getenv("OPENAI_API_KEY", "").strip())
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_tabs.py")
+    sys.argv = ["streamlit", "run", app, *sys.argv[1:]]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# serving.py — process-wide serving state: shared index and OpenAI clients, startup warm-up,
+# and a readiness probe for the load balancer
+
+import os, json, time, logging, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+import streamlit as st
+from langchain_community.vectorstores import FAISS
+from langchain_openai import ChatOpenAI
+
+from knowledge_base import (
+    FAISS_MMAP, KB_SHARDED, METADATA_FILE, SHARD_NAMES, _load_faiss, current_index_dir,
+    get_embeddings, index_exists, index_fingerprint, index_roots, kb_exists, kb_staleness,
+)
+from index_builder import builder as index_builder
+from kb_watcher import KB_WATCH, watcher as kb_watcher
+from sharded_search import ShardedStore
+from snapshot import SNAPSHOT_FILE, read_header
+
+log = logging.getLogger(__name__)
+
+MODEL_NAME      = "gpt-4o-mini"
+TEMPERATURE     = 0.0
+
+READINESS_PORT  = int(os.getenv("READINESS_PORT", "8502"))   # 0 disables the probe server
+WARMUP_QUERY    = "What are the types of shallow foundations?"
+WARMUP_LLM      = os.getenv("WARMUP_LLM", "1") == "1"         # one max_tokens=1 chat call
+WARMUP_RETRIES  = 3
+
+# ---------------- Shared resources ----------------
+@st.cache_resource(show_spinner=False, max_entries=len(SHARD_NAMES) + 1)
+def _shared_vectorstore(path: str, api_key: str, fingerprint: tuple) -> FAISS:
+    # One read-only index (per shard) per server process, shared by every session.
+    # `fingerprint` is only part of the cache key: a rebuilt index gets a new entry
+    # and the old one is evicted (LRU) once every session has moved on.
+    return _load_faiss(path, get_embeddings(api_key), mmap=FAISS_MMAP)
+
+def get_shared_vectorstore(api_key: str):
+    stores = {}
+    for name, root in index_roots().items():
+        path = current_index_dir(root)
+        if index_exists(path):
+            stores[name] = _shared_vectorstore(path, api_key, index_fingerprint(path))
+    if not stores:
+        return None
+    return ShardedStore(stores) if KB_SHARDED else stores["all"]
+
+@st.cache_resource(show_spinner=False)
+def get_llm(api_key: str) -> ChatOpenAI:
+    # shared so every session reuses one HTTP connection pool (warmed at startup)
+    return ChatOpenAI(temperature=TEMPERATURE, model=MODEL_NAME, api_key=api_key)
+
+# ---------------- Warm-up ----------------
+class Readiness:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready, self.stage, self.detail = False, "starting", None
+        self.started_at = time.time()
+
+    def set(self, stage: str, ready: bool = False, detail: Optional[str] = None) -> None:
+        with self._lock:
+            self.ready, self.stage, self.detail = ready, stage, detail
+        log.info("readiness: %s%s", stage, f" ({detail})" if detail else "")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"ready": self.ready, "stage": self.stage, "detail": self.detail,
+                    "uptime_s": round(time.time() - self.started_at, 1)}
+
+readiness = Readiness()
+
+def touch_index_pages() -> int:
+    """Read every published index file once so mmapped pages are in the page cache.
+
+    A quantized index's vectors.npy is left out: re-ranking reads only each query's
+    candidate rows, and paging the whole file in would undo the codes' memory saving.
+    """
+    total = 0
+    for root in index_roots().values():
+        path = current_index_dir(root)
+        try:
+            names = sorted(os.listdir(path))
+        except FileNotFoundError:
+            continue
+        skip = {METADATA_FILE, "index.pkl"}
+        if SNAPSHOT_FILE in names and read_header(path)["index"]["quantization"] != "none":
+            skip.add("vectors.npy")
+        for name in names:
+            if name in skip or not os.path.isfile(os.path.join(path, name)):
+                continue
+            try:
+                with open(os.path.join(path, name), "rb") as f:
+                    while block := f.read(1 << 20):
+                        total += len(block)
+            except FileNotFoundError:
+                pass
+    return total
+
+def warm_up(api_key: str) -> None:
+    if not api_key:
+        readiness.set("missing_key", detail="OPENAI_API_KEY is not set")
+        return
+    staleness = kb_staleness()
+    if not kb_exists() or staleness["embedding_changed"]:
+        # nothing servable yet: an index built at another EMBEDDING_DIMENSIONS is refused on load
+        if not staleness["signature"]:
+            readiness.set("no_pdfs", detail="no servable index and no PDFs to build one from")
+            return
+        readiness.set("indexing")
+        index_builder.start(api_key, key=staleness["signature"])
+        index_builder.wait()
+        if not kb_exists():
+            readiness.set("build_failed", detail=index_builder.error)
+            return
+    for attempt in range(1, WARMUP_RETRIES + 1):
+        try:
+            readiness.set("loading index")
+            store = get_shared_vectorstore(api_key)
+            readiness.set("touching pages")
+            touched = touch_index_pages()
+            readiness.set("warm query")
+            # embeds once through the shared embeddings client, then searches each shard
+            # directly: the retriever would route WARMUP_QUERY to the shallow shard only
+            shards = list(store.stores.values()) if isinstance(store, ShardedStore) else [store]
+            embedding = shards[0]._embed_query(WARMUP_QUERY)
+            for shard in shards:
+                shard.similarity_search_by_vector(embedding, k=3)
+            if WARMUP_LLM:
+                get_llm(api_key).invoke("ping", max_tokens=1)
+            readiness.set("ready", ready=True, detail=f"{touched / 2**20:.1f} MB of index pages touched")
+            return
+        except Exception as e:
+            log.exception("Warm-up attempt %d failed", attempt)
+            readiness.set("warm-up failed", detail=str(e))
+            time.sleep(2 ** attempt)
+
+# ---------------- Readiness probe ----------------
+class _ProbeHandler(BaseHTTPRequestHandler):
+    # GET /ready -> 200 once warm, 503 before; GET /live -> 200 while the process is up
+    def do_GET(self):
+        if self.path.startswith("/ready"):
+            body = readiness.snapshot()
+            code = 200 if body["ready"] else 503
+        elif self.path.startswith("/live"):
+            body, code = {"alive": True}, 200
+        else:
+            body, code = {"error": "not found"}, 404
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass  # probes hit this every few seconds
+
+_start_lock = threading.Lock()
+_started = False
+
+def start(api_key: str, port: int = READINESS_PORT) -> None:
+    """Start the readiness probe and warm-up once per process; later calls are no-ops."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    if port:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", port), _ProbeHandler)
+            threading.Thread(target=server.serve_forever, name="readiness-probe", daemon=True).start()
+        except OSError as e:
+            log.warning("Readiness probe not started on port %d: %s", port, e)
+    threading.Thread(target=warm_up, args=(api_key,), name="warm-up", daemon=True).start()
+    if api_key and KB_WATCH:
+        kb_watcher.start(api_key)
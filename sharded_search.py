@@ -0,0 +1,63 @@
+# sharded_search.py — fan a query out over topic shards (or route it to one) and merge hits
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain.docstore.document import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from knowledge_base import GENERAL_SHARD, SHARD_NAMES
+
+# A question that matches exactly one shard's terms is searched there only;
+# anything else (no match, or several topics) fans out to every shard.
+QUERY_RULES = {
+    "shallow":      r"\bshallow\b|\bfootings?\b|\bspread\b|\bmat foundation|\braft\b|\bbearing capacity\b",
+    "deep":         r"\bdeep\b|\bpiles?\b|\bpiling\b|drilled shaft|\bcaissons?\b|augercast|\bdriven\b",
+    "dewatering":   r"dewater|groundwater|well ?points?|\bpumping\b|water table",
+    "cold_regions": r"permafrost|\bfrost\b|cold region|\bfreez|\bthaw",
+}
+
+# shared by every session; FAISS searches release the GIL, so shards run in parallel
+_POOL = ThreadPoolExecutor(max_workers=len(SHARD_NAMES), thread_name_prefix="shard-search")
+
+
+def route_query(query: str, shards) -> Optional[str]:
+    """The one shard a question is clearly about, or None to fan out."""
+    q = query.lower()
+    hits = [s for s, rule in QUERY_RULES.items() if s in shards and re.search(rule, q)]
+    return hits[0] if len(hits) == 1 else None
+
+
+class ShardedRetriever(BaseRetriever):
+    stores: Dict[str, Any]
+    k: int = 3
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        target = route_query(query, self.stores)
+        names = [target] if target else list(self.stores)
+        # embed once; every shard uses the same model, so L2 scores are comparable
+        embedding = self.stores[names[0]]._embed_query(query)
+        futures = {n: _POOL.submit(self.stores[n].similarity_search_with_score_by_vector, embedding, self.k)
+                   for n in names}
+        hits = []
+        for name, fut in futures.items():
+            for doc, score in fut.result():
+                hits.append((score, Document(page_content=doc.page_content, metadata=dict(doc.metadata, shard=name))))
+        hits.sort(key=lambda h: h[0])
+        return [doc for _, doc in hits[:self.k]]
+
+
+class ShardedStore:
+    """The loaded shards, standing in for a single FAISS store in make_chain()."""
+
+    def __init__(self, stores: Dict[str, Any]):
+        # general last so ties favour the topical shards
+        self.stores = dict(sorted(stores.items(), key=lambda kv: kv[0] == GENERAL_SHARD))
+
+    def as_retriever(self, search_kwargs: Optional[Dict] = None) -> ShardedRetriever:
+        return ShardedRetriever(stores=self.stores, k=(search_kwargs or {}).get("k", 3))
@@ -0,0 +1,150 @@
+# snapshot.py — pickle-free index snapshot: mmap-able vectors, row-ordered ids, columnar chunk table
+#
+# Layout of a snapshot directory (format version 1):
+#   snapshot.json              format/version, row count, dim, index kind, embedding model/size;
+#                              written last
+#   vectors.npy                (n, d), row i = FAISS row i: float32, or the re-rank copy at
+#                              RERANK_DTYPE (float16 by default) beside quantized codes
+#   index.faiss                only for HNSW/IVF or quantized indexes (flat search runs off vectors.npy)
+#   chunks.<col>.offsets.npy   int64 (n + 1) }  string columns: id, text, source, meta (JSON of
+#   chunks.<col>.data.npy      uint8 UTF-8   }  any other metadata keys)
+#   chunks.page.npy            int32 (n,), -1 when a chunk has no page
+# Every array loads with np.load(mmap_mode="r"): opening a snapshot reads a few hundred
+# bytes, and a search touches only the rows of its hits.
+
+import os, json
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+
+SNAPSHOT_FILE    = "snapshot.json"
+SNAPSHOT_FORMAT  = "kb-snapshot"
+SNAPSHOT_VERSION = 1
+STRING_COLUMNS   = ("id", "text", "source", "meta")
+
+
+def _write_strings(path: str, col: str, values: List[str]) -> None:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype="int64")
+    np.save(os.path.join(path, f"chunks.{col}.offsets.npy"), offsets)
+    np.save(os.path.join(path, f"chunks.{col}.data.npy"), np.frombuffer(b"".join(encoded), dtype="uint8"))
+
+
+class _StringColumn:
+    def __init__(self, path: str, col: str, mmap_mode: Optional[str]):
+        self.offsets = np.load(os.path.join(path, f"chunks.{col}.offsets.npy"), mmap_mode=mmap_mode)
+        self.data = np.load(os.path.join(path, f"chunks.{col}.data.npy"), mmap_mode=mmap_mode)
+
+    def __getitem__(self, row: int) -> str:
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class ChunkTable:
+    """Row-addressed view over the chunk columns."""
+
+    def __init__(self, path: str, mmap_mode: Optional[str] = "r"):
+        self.cols = {c: _StringColumn(path, c, mmap_mode) for c in STRING_COLUMNS}
+        self.page = np.load(os.path.join(path, "chunks.page.npy"), mmap_mode=mmap_mode)
+
+    def __len__(self) -> int:
+        return len(self.page)
+
+    def chunk_id(self, row: int) -> str:
+        return self.cols["id"][row]
+
+    def document(self, row: int) -> Document:
+        meta = {"source": self.cols["source"][row]}
+        if self.page[row] >= 0:
+            meta["page"] = int(self.page[row])
+        extra = self.cols["meta"][row]
+        if extra:
+            meta.update(json.loads(extra))
+        return Document(page_content=self.cols["text"][row], metadata=meta)
+
+
+class SnapshotDocstore(Docstore):
+    """Docstore keyed by FAISS row: pairs with RowIdMap so a hit needs no id lookup table."""
+
+    def __init__(self, table: ChunkTable):
+        self._table = table
+
+    def search(self, search) -> Document:
+        return self._table.document(int(search))
+
+
+class RowIdMap(Mapping):
+    """index_to_docstore_id for a snapshot: row i maps to docstore key i, without storing n entries."""
+
+    def __init__(self, n: int):
+        self._n = n
+
+    def __getitem__(self, row: int) -> int:
+        if not 0 <= row < self._n:
+            raise KeyError(row)
+        return int(row)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self):
+        return iter(range(self._n))
+
+
+def write_snapshot(path: str, vectors: np.ndarray, ids: List[str], docs: List[Document],
+                   index_info: Dict, write_index=None, embedding: Optional[Dict] = None) -> None:
+    """Write a snapshot into an empty directory. `write_index(file)` saves index.faiss if needed."""
+    os.makedirs(path, exist_ok=True)
+    dtype = "float16" if vectors.dtype == np.float16 else "float32"
+    np.save(os.path.join(path, "vectors.npy"), np.ascontiguousarray(vectors, dtype=dtype))
+    if write_index is not None:
+        write_index(os.path.join(path, "index.faiss"))
+    extras = []
+    for d in docs:
+        rest = {k: v for k, v in d.metadata.items() if k not in ("source", "page")}
+        extras.append(json.dumps(rest) if rest else "")
+    _write_strings(path, "id", [str(i) for i in ids])
+    _write_strings(path, "text", [d.page_content for d in docs])
+    _write_strings(path, "source", [str(d.metadata.get("source", "")) for d in docs])
+    _write_strings(path, "meta", extras)
+    np.save(os.path.join(path, "chunks.page.npy"),
+            np.array([int(d.metadata.get("page", -1)) for d in docs], dtype="int32"))
+    header = {
+        "format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION,
+        "count": len(ids), "dim": int(vectors.shape[1]),
+        "metric": "l2", "index": dict(index_info, file="index.faiss" if write_index else None),
+        "embedding": embedding,
+    }
+    with open(os.path.join(path, SNAPSHOT_FILE), "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+
+
+def read_header(path: str) -> Dict:
+    with open(os.path.join(path, SNAPSHOT_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported index snapshot {header.get('format')} v{header.get('version')} in {path}")
+    return header
+
+
+def open_snapshot(path: str) -> Tuple[np.ndarray, SnapshotDocstore, RowIdMap]:
+    """Zero-copy view for serving: (memory-mapped vectors, docstore, id map)."""
+    header = read_header(path)
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+    return vectors, SnapshotDocstore(ChunkTable(path)), RowIdMap(header["count"])
+
+
+def read_snapshot(path: str) -> Tuple[np.ndarray, Dict[str, Document], Dict[int, str]]:
+    """Materialized copy for editing: (vectors, {id: Document}, {row: id})."""
+    read_header(path)
+    vectors = np.load(os.path.join(path, "vectors.npy"))
+    table = ChunkTable(path, mmap_mode=None)
+    ids = [table.chunk_id(r) for r in range(len(table))]
+    return vectors, {i: table.document(r) for r, i in enumerate(ids)}, dict(enumerate(ids))
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from chunker import Splitter
+
+PIECES = ["word", "a", "longerword", " ", " ", " ", "\n", "\n\n", "  ", "\n \n", "\t", "\n\n\n"]
+
+
+def random_text(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice(PIECES) if rng.random() < 0.5 else "x" * rng.randint(1, 40) + " " for _ in range(n))
+
+
+def by_thirds(text: str) -> int:
+    return (len(text) + 2) // 3   # a length function that, like tokens, isn't characters
+
+
+@pytest.mark.parametrize("length", [None, by_thirds], ids=["chars", "custom"])
+def test_matches_recursive_character_text_splitter(length):
+    rng = random.Random(7)
+    for _ in range(500):
+        size = rng.choice([5, 10, 37, 100, 1000])
+        overlap = rng.randint(0, size)
+        text = random_text(rng, rng.randint(0, 600))
+        kwargs = {"length_function": length} if length else {}
+        expected = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap, **kwargs).split_text(text)
+        spans = Splitter(size, overlap, length).split(text)
+        assert [chunk for _, _, chunk in spans] == expected, (size, overlap, text)
+        assert all(text[start:end] == chunk for start, end, chunk in spans)
+
+
+def test_split_documents_copies_metadata():
+    docs = [Document(page_content="alpha beta gamma " * 40, metadata={"source": "a.pdf", "page": 1})]
+    expected = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20).split_documents(docs)
+    got = Splitter(100, 20).split_documents(docs)
+    assert [(c.page_content, c.metadata) for c in got] == [(c.page_content, c.metadata) for c in expected]
+    got[0].metadata["tokens"] = 1
+    assert "tokens" not in got[1].metadata and "tokens" not in docs[0].metadata
+
+
+def test_split_pages_records_page_ranges():
+    pages = [Document(page_content=f"a line of page {p}\n" * 3, metadata={"source": "a.pdf", "page": p})
+             for p in (1, 2, 3)]
+    chunks = Splitter(60, 0).split_pages(pages)
+    assert chunks[0].metadata["pages"][0] == 1 and chunks[-1].metadata["pages"][1] == 3
+    for chunk in chunks:
+        first, last = chunk.metadata["pages"]
+        assert chunk.metadata["page"] == first <= last
+        assert f"page {first}" in chunk.page_content and f"page {last}" in chunk.page_content
+
+
+def test_overlap_larger_than_size_is_rejected():
+    with pytest.raises(ValueError):
+        Splitter(10, 20)
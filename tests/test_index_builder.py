@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+import index_builder
+from index_builder import IndexBuilder
+
+
+def run(builder, key):
+    started = builder.start("key", key=key)
+    builder.wait()
+    return started
+
+
+@pytest.fixture
+def failing(monkeypatch):
+    calls = []
+
+    def fail_with(error):
+        def update(*args, **kwargs):
+            calls.append(error)
+            raise error
+        monkeypatch.setattr(index_builder, "update_knowledge_base", update)
+    return fail_with, calls
+
+
+def test_transient_failure_is_retried_after_backoff(failing, monkeypatch):
+    fail_with, calls = failing
+    monkeypatch.setattr(index_builder, "RETRY_BASE_S", 60)
+    now = [1000.0]
+    monkeypatch.setattr(index_builder, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    builder = IndexBuilder()
+    fail_with(ConnectionError("connection reset"))
+
+    assert run(builder, "sig")
+    assert builder.retry_in() == 60 and not run(builder, "sig")   # still backing off
+    now[0] += 60
+    assert run(builder, "sig")
+    assert builder.retry_in() == 120   # doubled after a second failure in a row
+    now[0] += 119
+    assert not run(builder, "sig")
+    now[0] += 1
+    assert run(builder, "sig") and len(calls) == 3
+
+
+def test_deterministic_failure_waits_for_a_new_folder_state(failing):
+    fail_with, calls = failing
+    builder = IndexBuilder()
+    fail_with(RuntimeError("tiktoken encoding 'o200k_base' is not available"))
+
+    assert run(builder, "sig")
+    assert builder.error and builder.retry_in() is None
+    assert not run(builder, "sig")
+    assert run(builder, "sig2")              # the folder changed
+    assert run(builder, None) and len(calls) == 3   # explicit starts are never blocked
+
+
+def test_success_clears_the_failure_count(failing, monkeypatch):
+    fail_with, _ = failing
+    monkeypatch.setattr(index_builder, "RETRY_BASE_S", 0)
+    builder = IndexBuilder()
+    fail_with(TimeoutError("build lock busy"))
+    run(builder, "sig")
+    monkeypatch.setattr(index_builder, "update_knowledge_base", lambda *a, **k: {})
+    assert run(builder, "sig")
+    assert builder.error is None and builder.retry_in() is None and not run(builder, "sig")
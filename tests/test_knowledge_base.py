@@ -0,0 +1,199 @@
+import os
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+import knowledge_base as kb
+from knowledge_base import doc_name, file_sha256, plan_update, read_manifest, update_vectorstore
+
+
+class WordTokens:
+    """Stands in for the tiktoken encoding, which a test host may not have fetched."""
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+    def encode_ordinary_batch(self, texts):
+        return [t.split() for t in texts]
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    monkeypatch.setattr(kb, "KNOWLEDGE_DIR", str(docs))
+    monkeypatch.setattr(kb, "KB_PAGE_CACHE", False)
+    monkeypatch.setattr(kb, "tokenizer", WordTokens)
+    monkeypatch.setattr(kb, "get_embeddings", lambda api_key, dimensions=None: DeterministicFakeEmbedding(size=8))
+    return docs
+
+
+def pages(name, n, version=1):
+    return [f"{name} v{version} page {p} " + " ".join(f"{name}{p}w{i}" for i in range(8)) for p in range(1, n + 1)]
+
+
+def entry(pdf, **extra):
+    s = os.stat(pdf)
+    return dict({"sha256": file_sha256(pdf), "size": s.st_size, "mtime": s.st_mtime}, **extra)
+
+
+def names(plan, key):
+    return sorted(doc_name(p) for p in plan[key])
+
+
+def test_plan_update_classifies_files(folder, make_pdf):
+    same = make_pdf(folder / "same.pdf", pages("same", 1))
+    touched = make_pdf(folder / "touched.pdf", pages("touched", 1))
+    changed = make_pdf(folder / "changed.pdf", pages("changed", 1))
+    manifest = {"files": {"same.pdf": entry(same), "touched.pdf": entry(touched), "changed.pdf": entry(changed),
+                          "gone.pdf": {"sha256": "0", "size": 1, "mtime": 0}}}
+    make_pdf(folder / "changed.pdf", pages("changed", 2))
+    os.utime(touched, (0, 12345))   # new mtime, same bytes
+    (folder / "sub").mkdir()
+    new = make_pdf(folder / "sub" / "new.pdf", pages("new", 1))
+
+    plan = plan_update([same, touched, changed, new], manifest)
+
+    assert names(plan, "unchanged") == ["same.pdf", "touched.pdf"]
+    assert names(plan, "touched") == ["touched.pdf"]
+    assert names(plan, "changed") == ["changed.pdf"]
+    assert names(plan, "new") == ["sub/new.pdf"]
+    assert plan["deleted"] == ["gone.pdf"]
+    assert plan["sha256"]["changed.pdf"] == file_sha256(changed) != manifest["files"]["changed.pdf"]["sha256"]
+
+
+def test_plan_update_retries_only_on_request(folder, make_pdf):
+    ok = make_pdf(folder / "ok.pdf", pages("ok", 1))
+    partial = make_pdf(folder / "partial.pdf", pages("partial", 1))
+    failed = make_pdf(folder / "failed.pdf", pages("failed", 1))
+    manifest = {"files": {"ok.pdf": entry(ok),
+                          "partial.pdf": entry(partial, quarantined=[{"pages": [1, 1], "reason": "timeout"}]),
+                          "failed.pdf": entry(failed, error="broken xref")}}
+    pdfs = [ok, partial, failed]
+
+    assert names(plan_update(pdfs, manifest), "unchanged") == ["failed.pdf", "ok.pdf", "partial.pdf"]
+    plan = plan_update(pdfs, manifest, retry_quarantined=True)
+    assert names(plan, "unchanged") == ["ok.pdf"]
+    assert names(plan, "changed") == names(plan, "retry") == ["failed.pdf", "partial.pdf"]
+
+
+def chunk_ranges(root):
+    manifest = read_manifest(root=root)
+    return manifest, {name: tuple(e["chunk_ids"]) for name, e in manifest["files"].items()}
+
+
+def assert_ranges_match_index(root, manifest):
+    # every file owns [start, end) of the chunk ids; together they are exactly the published index
+    vs = kb._load_faiss(kb.current_index_dir(root), DeterministicFakeEmbedding(size=8), writable=True)
+    expected = {str(i): name for name, e in manifest["files"].items() for i in range(*e["chunk_ids"])}
+    ids = [vs.index_to_docstore_id[row] for row in range(vs.index.ntotal)]
+    assert sorted(ids, key=int) == sorted(expected, key=int)
+    assert all(vs.docstore.search(i).metadata["source"] == expected[i] for i in ids)
+    assert manifest["next_chunk_id"] > max(map(int, expected), default=-1)
+
+
+def test_incremental_update_keeps_chunk_id_ranges(folder, tmp_path, make_pdf):
+    root = str(tmp_path / "vectorstore")
+    a = make_pdf(folder / "a.pdf", pages("a", 3))
+    b = make_pdf(folder / "b.pdf", pages("b", 2))
+    c = make_pdf(folder / "c.pdf", pages("c", 4))
+
+    _, report = update_vectorstore("key", [a, b, c], root=root)
+    manifest, ranges = chunk_ranges(root)
+    assert sorted(report["new"]) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert ranges == {"a.pdf": (0, 3), "b.pdf": (3, 5), "c.pdf": (5, 9)} and manifest["next_chunk_id"] == 9
+    assert_ranges_match_index(root, manifest)
+
+    make_pdf(folder / "b.pdf", pages("b", 3, version=2))
+    d = make_pdf(folder / "d.pdf", pages("d", 1))
+    vs, report = update_vectorstore("key", [a, b, d], root=root)   # c.pdf deleted
+    manifest, ranges = chunk_ranges(root)
+    assert (report["changed"], report["new"], report["deleted"], report["removed_chunks"]) == \
+        (["b.pdf"], ["d.pdf"], ["c.pdf"], 6)
+    # the untouched file keeps its ids; new chunks never reuse an id
+    assert ranges == {"a.pdf": (0, 3), "b.pdf": (9, 12), "d.pdf": (12, 13)} and manifest["next_chunk_id"] == 13
+    assert_ranges_match_index(root, manifest)
+    assert "b v2 page 1" in vs.docstore.search("9").page_content
+
+    _, report = update_vectorstore("key", [a, b, d], root=root)
+    assert report["unchanged"] == ["a.pdf", "b.pdf", "d.pdf"] and chunk_ranges(root)[1] == ranges
+
+
+def test_plan_update_refolds_chains_of_folded_files(folder, make_pdf):
+    pdfs = {n: make_pdf(folder / f"{n}.pdf", pages(n, 1)) for n in ("b", "c", "d", "e")}
+    manifest = {"files": {"a.pdf": {"sha256": "0", "size": 1, "mtime": 0},
+                          "b.pdf": entry(pdfs["b"], folded_into=["a.pdf"]),
+                          "c.pdf": entry(pdfs["c"], folded_into=["b.pdf"]),   # only via b
+                          "d.pdf": entry(pdfs["d"], folded_into=["e.pdf"]),
+                          "e.pdf": entry(pdfs["e"])}}
+
+    plan = plan_update(list(pdfs.values()), manifest)   # a.pdf deleted
+
+    assert [doc_name(p) for p in plan["refold"]] == ["b.pdf", "c.pdf"]
+    assert names(plan, "changed") == ["b.pdf", "c.pdf"] and names(plan, "unchanged") == ["d.pdf", "e.pdf"]
+
+
+def test_deleting_a_canonical_file_restores_its_folded_chunks(folder, tmp_path, make_pdf):
+    root = str(tmp_path / "vectorstore")
+    shared = "shared clause every contractor signs before the work on site starts"
+    own_b = "only b describes the drainage layer under the slab in detail"
+    a = make_pdf(folder / "a.pdf", [shared, "only a covers the pile cap reinforcement schedule"])
+    b = make_pdf(folder / "b.pdf", [shared, own_b])
+    c = make_pdf(folder / "c.pdf", [own_b, "only c lists the inspection hold points for concrete"])
+
+    _, report = update_vectorstore("key", [a, b, c], root=root)
+    files = read_manifest(root=root)["files"]
+    assert report["duplicate_chunks"] == 2
+    assert files["b.pdf"]["folded_into"] == ["a.pdf"] and files["c.pdf"]["folded_into"] == ["b.pdf"]
+
+    _, report = update_vectorstore("key", [b, c], root=root)
+    assert report["deleted"] == ["a.pdf"] and report["refolded"] == ["b.pdf", "c.pdf"]
+    vs = kb._load_faiss(kb.current_index_dir(root), DeterministicFakeEmbedding(size=8), writable=True)
+    texts = sorted((d.page_content.strip(), d.metadata["source"]) for d in vs.docstore._dict.values())
+    assert texts == sorted([(shared, "b.pdf"), (own_b, "b.pdf"),
+                            ("only c lists the inspection hold points for concrete", "c.pdf")])
+    files = read_manifest(root=root)["files"]
+    assert "folded_into" not in files["b.pdf"] and files["c.pdf"]["folded_into"] == ["b.pdf"]
+
+
+
+WORDS = ["piles", "footings", "rafts", "caissons", "anchors", "walls", "slabs", "grout"]
+
+
+def body(p):
+    return f"{WORDS[p]} carry the load\nSee Table 3\ndesign notes on {WORDS[p]}"
+
+
+def manual_pages(n, extra=""):
+    return [kb.Document(page_content=f"{extra}ACME Foundations Manual\nSection {p}\n{body(p)}\nPage {p} of {n}",
+                        metadata={"source": "m.pdf", "page": p}) for p in range(1, n + 1)]
+
+
+def test_strip_boilerplate_removes_running_headers_and_footers():
+    kept, removed = kb.strip_boilerplate(manual_pages(6))
+    # "Section N" and "Page N of 6" differ only in digits, so each counts as one repeated line;
+    # "See Table 3" repeats too, but in the middle of the page, where body text lives
+    assert [d.page_content for d in kept] == [body(p) for p in range(1, 7)]
+    assert removed == sum(len(d.page_content) - len(body(d.metadata["page"])) for d in manual_pages(6))
+
+
+def test_strip_boilerplate_keeps_lines_below_the_repeat_threshold():
+    docs = manual_pages(6)
+    for d in docs[:2]:
+        d.page_content = d.page_content.replace("ACME Foundations Manual", "Draft for review")  # 2 of 6 pages
+    kept, _ = kb.strip_boilerplate(docs)
+    assert kept[0].page_content == "Draft for review\n" + body(1)   # below half the pages: kept
+    assert kept[4].page_content == body(5)   # the header is still on 4 of 6
+
+
+def test_strip_boilerplate_leaves_short_documents_and_pages_alone():
+    short = manual_pages(2)
+    assert kb.strip_boilerplate(short) == (short, 0)   # too few pages to tell what repeats
+
+    docs = manual_pages(4) + [kb.Document(page_content="ACME Foundations Manual\nPage 5 of 5",
+                                          metadata={"source": "m.pdf", "page": 5}),
+                              kb.Document(page_content=" \n", metadata={"source": "m.pdf", "page": 6})]
+    kept, _ = kb.strip_boilerplate(docs)
+    # a two-line page has no edge zone, so it keeps its lines; a blank page is dropped
+    assert [d.metadata["page"] for d in kept] == [1, 2, 3, 4, 5]
+    assert kept[4].page_content == "ACME Foundations Manual\nPage 5 of 5"
@@ -0,0 +1,29 @@
+import os
+
+import pdf_extract
+from pdf_extract import extract_pdfs, extract_range
+
+
+def crash_on_bad(pdf, start, stop, page_budget=0):
+    # runs in the pool workers, which import this module by name
+    if "bad" in os.path.basename(pdf):
+        os._exit(1)
+    return extract_range(pdf, start, stop, page_budget)
+
+
+def test_crashing_worker_quarantines_only_its_ranges(tmp_path, monkeypatch, make_pdf):
+    monkeypatch.setattr(pdf_extract, "extract_range", crash_on_bad)
+    names = ["f0", "f1", "bad", "f3", "f4"]
+    pdfs = [make_pdf(tmp_path / f"{name}.pdf", [f"{name} page {p}" for p in (1, 2, 3)]) for name in names]
+
+    results = list(extract_pdfs(pdfs, workers=2, pages_per_task=2))
+
+    assert [r.pdf for r in results] == pdfs
+    for name, result in zip(names, results):
+        assert result.error is None and result.n_pages == 3
+        if name == "bad":
+            assert result.pages == []
+            assert result.skipped == [(1, 3, "extraction worker crashed")]
+        else:
+            assert result.skipped == []
+            assert [(p, text.strip()) for p, text in result.pages] == [(p, f"{name} page {p}") for p in (1, 2, 3)]
@@ -0,0 +1,92 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from faiss_index import NumpyFlatIndex
+from snapshot import SNAPSHOT_FILE, RowIdMap, open_snapshot, read_header, read_snapshot, write_snapshot
+
+DOCS = [
+    Document(page_content="plain ascii", metadata={"source": "a.pdf", "page": 0}),
+    Document(page_content="ünïcödé ✓", metadata={"source": "dir/b.pdf", "page": 12, "tokens": 4,
+                                                   "tags": ["x", "y"], "folded_into": None}),
+    Document(page_content="", metadata={"source": "c.pdf"}),  # no page: stored as -1, read back absent
+]
+IDS = ["7", "8", "9"]
+
+
+def write(path, docs=DOCS, ids=IDS, dim=4):
+    vectors = np.arange(len(ids) * dim, dtype="float32").reshape(len(ids), dim)
+    write_snapshot(str(path), vectors, ids, docs, {"type": "flat", "quantization": "none"})
+    return vectors
+
+
+def test_round_trip(tmp_path):
+    vectors = write(tmp_path)
+    header = read_header(str(tmp_path))
+    assert (header["count"], header["dim"], header["index"]["file"]) == (3, 4, None)
+
+    mapped, docstore, id_map = open_snapshot(str(tmp_path))
+    assert isinstance(mapped, np.memmap)
+    np.testing.assert_array_equal(mapped, vectors)
+    got = [docstore.search(id_map[row]) for row in range(len(IDS))]
+    assert [(d.page_content, d.metadata) for d in got] == [(d.page_content, d.metadata) for d in DOCS]
+
+    vectors2, docs, index_to_id = read_snapshot(str(tmp_path))
+    np.testing.assert_array_equal(vectors2, vectors)
+    assert index_to_id == dict(enumerate(IDS))
+    assert [(docs[i].page_content, docs[i].metadata) for i in IDS] == [(d.page_content, d.metadata) for d in DOCS]
+
+
+def test_page_column_and_meta_json(tmp_path):
+    write(tmp_path)
+    assert np.load(tmp_path / "chunks.page.npy").tolist() == [0, 12, -1]
+    _, docs, _ = read_snapshot(str(tmp_path))
+    assert "page" not in docs["9"].metadata
+    assert docs["8"].metadata["tags"] == ["x", "y"] and docs["8"].metadata["folded_into"] is None
+    assert docs["7"].metadata == {"source": "a.pdf", "page": 0}  # no extra keys: empty meta cell
+
+
+def test_empty_snapshot(tmp_path):
+    write(tmp_path, docs=[], ids=[])
+    vectors, docstore, id_map = open_snapshot(str(tmp_path))
+    assert vectors.shape == (0, 4) and len(id_map) == 0 and list(id_map) == []
+    vectors, docs, index_to_id = read_snapshot(str(tmp_path))
+    assert vectors.shape == (0, 4) and docs == {} and index_to_id == {}
+    D, I = NumpyFlatIndex(np.load(tmp_path / "vectors.npy", mmap_mode="r")).search(np.zeros((2, 4), "float32"), 3)
+    assert (I == -1).all() and np.isinf(D).all()
+
+
+def test_unknown_version_is_refused(tmp_path):
+    write(tmp_path)
+    header = json.loads((tmp_path / SNAPSHOT_FILE).read_text())
+    (tmp_path / SNAPSHOT_FILE).write_text(json.dumps(dict(header, version=2)))
+    with pytest.raises(ValueError, match="Unsupported index snapshot"):
+        open_snapshot(str(tmp_path))
+
+
+def test_row_id_map_bounds():
+    m = RowIdMap(3)
+    assert m[0] == 0 and m[2] == 2 and m.get(3) is None
+    for row in (-1, 3):
+        with pytest.raises(KeyError):
+            m[row]
+    assert list(m) == [0, 1, 2] and dict(m.items()) == {0: 0, 1: 1, 2: 2}
+
+
+@pytest.mark.parametrize("n,k", [(5, 8), (37, 5), (100, 100)])
+def test_numpy_flat_matches_index_flat_l2(monkeypatch, n, k):
+    monkeypatch.setattr(NumpyFlatIndex, "SCAN_BLOCK", 16)  # results span several blocks
+    rng = np.random.default_rng(n)
+    vectors = rng.standard_normal((n, 8)).astype("float32")
+    queries = rng.standard_normal((6, 8)).astype("float32")
+    ref = faiss.IndexFlatL2(8)
+    ref.add(vectors)
+    D_ref, I_ref = ref.search(queries, k)
+    D, I = NumpyFlatIndex(vectors).search(queries, k)
+    np.testing.assert_array_equal(I, I_ref)
+    found = I_ref >= 0
+    np.testing.assert_allclose(D[found], D_ref[found], rtol=1e-4, atol=1e-4)
+    assert np.isinf(D[~found]).all()